@@ -0,0 +1,280 @@
+"""
+Local analysis service: an asyncio server in front of a process pool whose
+workers keep SBML models and their compiled Gurobi models loaded between
+jobs, so that repeated calls do not pay for reading and converting the
+model.
+
+Clients send one JSON object per line and receive JSON lines back, tagged
+with the id of their job:
+
+    {"id": 1, "job": "summary", "model": "models/recon2.xml"}
+    {"id": 2, "job": "balance", "model": "models/recon2.xml"}
+    {"id": 3, "job": "fba", "model": "models/recon2.xml",
+     "objectives": ["DM_atp_c_"], "medium": {"EX_glc(e)": 1}}
+    {"id": 4, "job": "sweep", "model": "models/recon2.xml",
+     "objectives": ["DM_atp_c_", "HXPRT"], "media": [{...}, {...}],
+     "infinite_bounds": true}
+
+Each job answers with one {"event": "result", "index": i, "result": ...}
+message per result (one per medium for sweeps, as they complete) followed by
+{"event": "done"}, or {"event": "error", "message": ...}. Identical jobs in
+flight at the same time are solved once. JSON has no infinity or NaN, so
+unbounded and infeasible objective values are sent as the strings "inf",
+"-inf" and "nan", which float() parses back.
+
+    python analysis_service.py --port 8765 --processes 4 models/*.xml
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import socket
+
+import libsbml
+
+from media import solve_media
+from metabolicModeling import get_compiled_model, model_balancing, \
+    model_statistics, release_compiled_model, set_infinite_bounds, \
+    solve_objectives
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+# SBML documents loaded by a pool worker, by (path, mtime, infinite_bounds)
+_models = {}
+
+
+def load_model(path, infinite_bounds=False):
+    '''
+    Return the SBML document of path from the cache of this process,
+    reading and compiling it if the file is new or has changed.
+    '''
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+    key = (path, mtime, infinite_bounds)
+    if key not in _models:
+        # drop the versions of the file that have changed since
+        for old in [k for k in _models if k[0] == path and k[1] != mtime]:
+            release_compiled_model(_models.pop(old))
+        sbml = libsbml.SBMLReader().readSBMLFromFile(path)
+        if sbml.getModel() is None:
+            raise ValueError('cannot read SBML model %s' % path)
+        if infinite_bounds:
+            set_infinite_bounds(sbml)
+        get_compiled_model(sbml)
+        _models[key] = sbml
+    return _models[key]
+
+
+def encode_message(message):
+    '''Encode a message as a JSON line, with non-finite floats as strings.'''
+    return (json.dumps(finite_floats(message), allow_nan=False) +
+            '\n').encode()
+
+
+def finite_floats(value):
+    '''Replace the non-finite floats in value by 'inf', '-inf' or 'nan'.'''
+    if isinstance(value, float) and not math.isfinite(value):
+        return repr(value)
+    if isinstance(value, dict):
+        return dict((key, finite_floats(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return [finite_floats(item) for item in value]
+    return value
+
+
+def init_worker(model_paths):
+    '''Pool initializer: load the models the service is started with.'''
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in model_paths:
+            load_model(path)
+
+
+def run_task(task):
+    '''Run one task in a pool worker and return a JSON-serialisable result.'''
+    with contextlib.redirect_stdout(io.StringIO()):
+        sbml = load_model(task['model'], task.get('infinite_bounds', False))
+        kind = task['kind']
+        if kind == 'summary':
+            return model_statistics(sbml)
+        if kind == 'balance':
+            return model_balancing(sbml)
+        if kind == 'solve':
+            if task.get('medium') is None:
+                return solve_objectives(sbml, task['objectives']).tolist()
+            return solve_media(sbml, [task['medium']],
+                               task['objectives'])[0].tolist()
+        raise ValueError('unknown task %s' % kind)
+
+
+def job_tasks(request):
+    '''Split a job request into the tasks run by the pool workers.'''
+    job = request.get('job')
+    common = {'model': request['model'],
+              'infinite_bounds': bool(request.get('infinite_bounds', False))}
+    if job in ['summary', 'balance']:
+        return [dict(common, kind=job)]
+    if job == 'fba':
+        return [dict(common, kind='solve', medium=request.get('medium'),
+                     objectives=request['objectives'])]
+    if job == 'sweep':
+        return [dict(common, kind='solve', medium=medium,
+                     objectives=request['objectives'])
+                for medium in request['media']]
+    raise ValueError('unknown job %s' % job)
+
+
+class AnalysisService(object):
+    '''
+    Accepts jobs from local clients and runs their tasks on a process pool,
+    sharing the result of identical tasks that are in flight together.
+    '''
+
+    def __init__(self, processes=None, model_paths=()):
+        # forked workers would inherit the client sockets open when they
+        # start, and keep them open after the clients go away
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            'forkserver' if 'forkserver' in methods else 'spawn')
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            processes, mp_context=context, initializer=init_worker,
+            initargs=(list(model_paths),))
+        self.in_flight = {}
+
+    async def submit(self, task):
+        '''Run task on the pool, or wait for an identical running task.'''
+        key = json.dumps(task, sort_keys=True)
+        future = self.in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, run_task, task)
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # a client going away must not cancel the task for the others
+        return await asyncio.shield(future)
+
+    async def run_job(self, request, send):
+        '''Run a job request and send its results as they complete.'''
+        job_id = request.get('id')
+        try:
+            tasks = job_tasks(request)
+
+            async def indexed(i, task):
+                return i, await self.submit(task)
+            for completed in asyncio.as_completed(
+                    [indexed(i, task) for i, task in enumerate(tasks)]):
+                i, result = await completed
+                await send({'id': job_id, 'event': 'result', 'index': i,
+                            'result': result})
+            await send({'id': job_id, 'event': 'done'})
+        except Exception as e:
+            await send({'id': job_id, 'event': 'error',
+                        'message': '%s: %s' % (type(e).__name__, e)})
+
+    async def handle_client(self, reader, writer):
+        '''Read job requests from a connection until it closes.'''
+        lock = asyncio.Lock()
+        connected = True
+
+        async def send(message):
+            nonlocal connected
+            async with lock:
+                if not connected:
+                    return
+                try:
+                    writer.write(encode_message(message))
+                    await writer.drain()
+                except ConnectionError:
+                    # the client went away: drop the rest of its messages
+                    connected = False
+
+        jobs = []
+        try:
+            while connected:
+                try:
+                    line = await reader.readline()
+                except ConnectionError:
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError('not a JSON object')
+                except ValueError as e:
+                    await send({'id': None, 'event': 'error',
+                                'message': 'invalid request: %s' % e})
+                    continue
+                jobs.append(asyncio.ensure_future(self.run_job(request,
+                                                               send)))
+            await asyncio.gather(*jobs)
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def serve(self, host=HOST, port=PORT, path=None):
+        '''Serve on a TCP port of host, or on a Unix socket at path.'''
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_client, path)
+        else:
+            server = await asyncio.start_server(self.handle_client, host,
+                                                port)
+        async with server:
+            await server.serve_forever()
+
+    def shutdown(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def request_jobs(requests, host=HOST, port=PORT, path=None):
+    '''
+    Send job requests to a running service and yield the messages it sends
+    back until every job is done or has failed.
+    '''
+    if path is not None:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path)
+    else:
+        connection = socket.create_connection((host, port))
+    with connection, connection.makefile('rw') as stream:
+        for request in requests:
+            stream.write(json.dumps(request) + '\n')
+        stream.flush()
+        pending = len(requests)
+        while pending:
+            line = stream.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if message['event'] in ['done', 'error']:
+                pending -= 1
+            yield message
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('models', nargs='*',
+                        help='SBML files to load in every worker at start')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--socket', help='serve on this Unix socket instead')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    service = AnalysisService(args.processes, args.models)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
@@ -0,0 +1,199 @@
+"""
+Timed benchmarks of the hot paths in metabolicModeling on synthetic models.
+
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json
+
+Results are written as JSON so that runs can be compared across commits.
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+import loopless
+import metabolicModeling as mm
+from synthetic_models import MODEL_SIZES, synthetic_model
+
+# max_fluxes solves 90 LPs per call, so only run it on the smaller models
+MAX_FLUXES_REACTIONS = 4000
+
+
+def bench_convert_sbml_to_cobra(sbml):
+    return lambda: mm.convert_sbml_to_cobra(sbml, mm.INF)
+
+
+def bench_easy_lp(sbml):
+    cobra = mm.convert_sbml_to_cobra(sbml, 1000.)
+    S = cobra['S']
+
+    def run():
+        return mm.easy_lp(list(cobra['c']), S, list(cobra['b']),
+                          list(cobra['lb']), list(cobra['ub']), one=False)
+    return run
+
+
+def bench_max_fluxes(sbml):
+    if sbml.getModel().getNumReactions() > MAX_FLUXES_REACTIONS:
+        return None
+    return lambda: mm.max_fluxes(sbml)
+
+
+def bench_optimize_cobra_model(sbml):
+    # a single bound change between solves, as in a parameter sweep
+    values = itertools.cycle([0., -10.])
+
+    def run():
+        mm.change_rxn_bounds(sbml, 'EX_glc(e)', next(values), 'l')
+        return mm.optimize_cobra_model(sbml)
+    return run
+
+
+def bench_loopless_fba(sbml):
+    def run():
+        # time the MILP construction as well as the solve
+        loopless.release_loopless_model(sbml)
+        return loopless.loopless_fba(sbml, precheck=False)
+    return run
+
+
+def bench_model_balancing(sbml):
+    return lambda: mm.model_balancing(sbml)
+
+
+def bench_model_summary(sbml):
+    return lambda: mm.modelSummary(sbml)
+
+
+BENCHMARKS = [
+    ('convert_sbml_to_cobra', bench_convert_sbml_to_cobra),
+    ('easy_lp', bench_easy_lp),
+    ('max_fluxes', bench_max_fluxes),
+    ('optimize_cobra_model', bench_optimize_cobra_model),
+    ('loopless_fba', bench_loopless_fba),
+    ('model_balancing', bench_model_balancing),
+    ('modelSummary', bench_model_summary),
+]
+
+
+def time_call(func, repeat=3):
+    '''
+    Wall-clock times in seconds of repeat calls to func, with its printed
+    output discarded.
+    '''
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmarks(sizes=None, benchmarks=None, repeat=3, seed=0):
+    '''
+    Run every benchmark on a synthetic model of every size and return the
+    results as a JSON-serialisable dictionary.
+    '''
+    if sizes is None:
+        sizes = MODEL_SIZES
+    if benchmarks is None:
+        benchmarks = [name for name, _ in BENCHMARKS]
+    results = []
+    for label, n_reactions in sizes:
+        for name, setup in BENCHMARKS:
+            if name not in benchmarks:
+                continue
+            # a fresh model per benchmark, as the benchmarks change bounds
+            # and leave compiled models behind
+            start = time.perf_counter()
+            sbml = synthetic_model(n_reactions, seed=seed, name=label)
+            build_time = time.perf_counter() - start
+            model = sbml.getModel()
+            result = {'benchmark': name,
+                      'model': label,
+                      'n_reactions': model.getNumReactions(),
+                      'n_species': model.getNumSpecies(),
+                      'build_time': build_time,
+                      'times': [],
+                      'error': None}
+            try:
+                func = setup(sbml)
+                if func is None:
+                    result['error'] = 'skipped'
+                else:
+                    result['times'] = time_call(func, repeat)
+            except Exception as e:
+                # e.g. a size-limited Gurobi licence on the larger models
+                result['error'] = '%s: %s' % (type(e).__name__, e)
+            finally:
+                loopless.release_loopless_model(sbml)
+                mm.release_compiled_model(sbml)
+            if result['times']:
+                result['min'] = min(result['times'])
+                result['median'] = float(np.median(result['times']))
+            results.append(result)
+            print('%-22s %-14s %s' % (name, label, result.get(
+                'median', result['error'])), file=sys.stderr)
+    return {'meta': {'python': platform.python_version(),
+                     'numpy': np.__version__,
+                     'platform': platform.platform(),
+                     'seed': seed,
+                     'repeat': repeat,
+                     'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+            'results': results}
+
+
+def compare_results(baseline, current, threshold=1.2):
+    '''
+    List the (benchmark, model, baseline, current) median times that got
+    slower than threshold times the baseline.
+    '''
+    reference = dict(((r['benchmark'], r['model']), r['median'])
+                     for r in baseline['results'] if 'median' in r)
+    regressions = []
+    for r in current['results']:
+        key = (r['benchmark'], r['model'])
+        if key in reference and 'median' in r and \
+                r['median'] > threshold * reference[key]:
+            regressions.append((key[0], key[1], reference[key], r['median']))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--sizes', nargs='+', metavar='LABEL',
+                        choices=[label for label, _ in MODEL_SIZES],
+                        help='model sizes to run (default: all)')
+    parser.add_argument('--benchmarks', nargs='+', metavar='NAME',
+                        choices=[name for name, _ in BENCHMARKS],
+                        help='benchmarks to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='report regressions against a previous run')
+    parser.add_argument('--threshold', type=float, default=1.2)
+    args = parser.parse_args()
+
+    sizes = [s for s in MODEL_SIZES if args.sizes is None or
+             s[0] in args.sizes]
+    results = run_benchmarks(sizes, args.benchmarks, args.repeat, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.threshold)
+        for name, label, before, after in regressions:
+            print('%s (%s): %.4gs -> %.4gs' % (name, label, before, after))
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,189 @@
+"""
+Columnar export and import of COBRA structures and flux solutions with
+Apache Arrow, so that downstream analyses read NumPy arrays instead of
+parsing SBML.
+
+Files ending in .parquet are written as Parquet; any other extension (e.g.
+.arrow) as Arrow IPC files, which are memory-mapped on reading so that the
+numeric columns come back as NumPy views on the file without copying.
+"""
+
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy import sparse
+
+# tables written by export_model, one file each
+MODEL_TABLES = ['reactions', 'metabolites', 'stoichiometry']
+
+
+def reaction_table(cobra):
+    '''
+    Reaction table of a COBRA structure from readSBML: id, lb, ub,
+    objective, gpr and reversible.
+    '''
+    return pa.table({'id': pa.array(list(cobra['rxns']), pa.string()),
+                     'lb': pa.array(cobra['lb'], pa.float64()),
+                     'ub': pa.array(cobra['ub'], pa.float64()),
+                     'objective': pa.array(cobra['c'], pa.float64()),
+                     'gpr': pa.array(cobra['grRules'], pa.string()),
+                     'reversible': pa.array(cobra['rev'], pa.bool_())})
+
+
+def metabolite_table(cobra):
+    '''
+    Metabolite table of a COBRA structure from readSBML: id, formula,
+    charge (a float, as SBML charges need not be integers; null when
+    unknown) and boundary.
+    '''
+    charge = np.asarray(cobra['metCharge'], dtype=float)
+    unknown = np.isnan(charge)
+    return pa.table({'id': pa.array(list(cobra['mets']), pa.string()),
+                     'formula': pa.array(cobra['metFormulas'], pa.string()),
+                     'charge': pa.array(charge, pa.float64(), mask=unknown),
+                     'boundary': pa.array(cobra['metBoundary'], pa.bool_())})
+
+
+def stoichiometry_table(S):
+    '''
+    Triplets (row, col, coefficient) of the nonzero entries of S, indexing
+    the metabolite and reaction tables, with the shape of S as metadata.
+    '''
+    S = sparse.coo_matrix(S)
+    table = pa.table({'row': pa.array(S.row.astype(np.int32)),
+                      'col': pa.array(S.col.astype(np.int32)),
+                      'coefficient': pa.array(S.data.astype(np.float64))})
+    return table.replace_schema_metadata(
+        {'shape': json.dumps([int(n) for n in S.shape])})
+
+
+def flux_table(fluxes, rxns, conditions):
+    '''
+    Long table (condition, reaction, flux) of a conditions x reactions flux
+    matrix, e.g. stacked easy_lp solutions or a sweep, with dictionary
+    encoded condition and reaction IDs, condition-major.
+    '''
+    fluxes = np.asarray(fluxes, dtype=np.float64)
+    n_cond, n_rxn = fluxes.shape
+    condition = pa.DictionaryArray.from_arrays(
+        np.repeat(np.arange(n_cond, dtype=np.int32), n_rxn),
+        pa.array([str(name) for name in conditions], pa.string()))
+    reaction = pa.DictionaryArray.from_arrays(
+        np.tile(np.arange(n_rxn, dtype=np.int32), n_cond),
+        pa.array([str(rID) for rID in rxns], pa.string()))
+    return pa.table({'condition': condition,
+                     'reaction': reaction,
+                     'flux': pa.array(fluxes.ravel())})
+
+
+def write_table(table, filename):
+    '''Write a table as Parquet (.parquet) or as an Arrow IPC file.'''
+    if filename.endswith('.parquet'):
+        pq.write_table(table, filename)
+    else:
+        with pa.OSFile(filename, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def read_table(filename):
+    '''
+    Read a table written by write_table; Arrow IPC files are memory-mapped
+    rather than read into memory.
+    '''
+    if filename.endswith('.parquet'):
+        return pq.read_table(filename)
+    return pa.ipc.open_file(pa.memory_map(filename, 'r')).read_all()
+
+
+def to_numpy(column):
+    '''
+    Return a table column as a NumPy array, without copying when it is a
+    single chunk of a primitive type with no nulls.
+    '''
+    if column.num_chunks == 1 and column.null_count == 0 and \
+            pa.types.is_primitive(column.type) and \
+            not pa.types.is_boolean(column.type):
+        return column.chunk(0).to_numpy(zero_copy_only=True)
+    return column.to_numpy()
+
+
+def export_model(cobra, directory, extension='.parquet'):
+    '''
+    Write the reaction, metabolite and stoichiometry tables of a COBRA
+    structure from readSBML to directory/<table><extension>.
+    '''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tables = {'reactions': reaction_table(cobra),
+              'metabolites': metabolite_table(cobra),
+              'stoichiometry': stoichiometry_table(cobra['S'])}
+    for name in MODEL_TABLES:
+        write_table(tables[name], os.path.join(directory, name + extension))
+
+
+def import_model(directory, extension='.parquet'):
+    '''
+    Read the tables written by export_model back into a COBRA structure
+    with NumPy arrays and S as a CSR matrix.
+    '''
+    tables = dict((name, read_table(os.path.join(directory,
+                                                 name + extension)))
+                  for name in MODEL_TABLES)
+    reactions = tables['reactions']
+    metabolites = tables['metabolites']
+    triplets = tables['stoichiometry']
+    shape = tuple(json.loads(triplets.schema.metadata[b'shape']))
+    S = sparse.csr_matrix((to_numpy(triplets['coefficient']),
+                           (to_numpy(triplets['row']),
+                            to_numpy(triplets['col']))), shape=shape)
+    charge = metabolites['charge'].to_numpy(zero_copy_only=False)
+    return {'rxns': np.array(reactions['id'].to_pylist()),
+            'mets': np.array(metabolites['id'].to_pylist()),
+            'S': S,
+            'lb': to_numpy(reactions['lb']),
+            'ub': to_numpy(reactions['ub']),
+            'c': to_numpy(reactions['objective']),
+            'b': np.zeros(shape[0]),
+            'rev': to_numpy(reactions['reversible']),
+            'grRules': reactions['gpr'].to_pylist(),
+            'metFormulas': metabolites['formula'].to_pylist(),
+            'metCharge': np.asarray(charge, dtype=float),
+            'metBoundary': to_numpy(metabolites['boundary']),
+            }
+
+
+def write_fluxes(filename, fluxes, rxns, conditions):
+    '''Write a conditions x reactions flux matrix, see flux_table.'''
+    write_table(flux_table(fluxes, rxns, conditions), filename)
+
+
+def read_fluxes(filename):
+    '''
+    Read a flux file from write_fluxes and return conditions, rxns and the
+    conditions x reactions flux matrix, which is a view on the memory-mapped
+    file for Arrow IPC files.
+    '''
+    table = read_table(filename)
+    condition = table['condition'].combine_chunks()
+    reaction = table['reaction'].combine_chunks()
+    conditions = condition.dictionary.to_pylist()
+    rxns = reaction.dictionary.to_pylist()
+    flux = to_numpy(table['flux'])
+    shape = (len(conditions), len(rxns))
+    row = condition.indices.to_numpy()
+    col = reaction.indices.to_numpy()
+    if len(flux) == shape[0] * shape[1] and \
+            np.array_equal(row.reshape(shape), np.broadcast_to(
+                np.arange(shape[0])[:, None], shape)) and \
+            np.array_equal(col.reshape(shape), np.broadcast_to(
+                np.arange(shape[1]), shape)):
+        return conditions, rxns, flux.reshape(shape)
+    # not in the layout of write_fluxes: scatter into the matrix
+    matrix = np.empty(shape)
+    matrix[:] = np.nan
+    matrix[row, col] = flux
+    return conditions, rxns, matrix
@@ -0,0 +1,271 @@
+"""
+Loopless FBA and FVA (Schellenberger et al. 2011, Biophys J 100:544).
+
+The loop law requires a vector G over the internal reactions with
+sign(G_i) = -sign(v_i) for v_i != 0 and N_int^T G = 0, where N_int spans the
+nullspace of the internal stoichiometric matrix. Rather than computing the
+nullspace, which is dense for genome-scale models, G is written as
+S_int^T mu over free metabolite potentials mu: the vectors orthogonal to the
+nullspace are exactly the row space of S_int, so this is the same
+constraint and keeps the sparsity of S. The MILP is built once per model and
+reused across scenarios; only bounds and objective are copied over before
+each solve.
+"""
+
+import gurobipy
+import numpy as np
+from scipy import sparse
+
+from metabolicModeling import INF, NAN, DocumentCache, get_compiled_model, \
+    get_reaction_by_id, grb_bound, solve_lp
+
+# |G_i| <= K for the loop law thermodynamic potentials
+K = 1000.
+TOL = 1e-9
+
+# loopless models of SBML documents; see get_loopless_model
+_loopless_models = DocumentCache()
+
+
+def get_internal_reactions(S):
+    '''
+    Return the indices of the columns of S with both a substrate and a
+    product, i.e. everything but source/sink reactions.
+    '''
+    S = sparse.csc_matrix(S)
+    nS = np.asarray((S < 0).sum(axis=0)).ravel()
+    nP = np.asarray((S > 0).sum(axis=0)).ravel()
+    return np.flatnonzero((nS > 0) & (nP > 0))
+
+
+def get_loop_candidates(S, internal):
+    '''
+    Return the internal reactions that can take part in a cycle: those left
+    after repeatedly removing the reactions through a metabolite that no
+    other remaining internal reaction touches, as a flux through them could
+    not be balanced within the cycle.
+    '''
+    A = (sparse.csc_matrix(S)[:, internal] != 0).astype(np.int64).tocsr()
+    keep = np.ones(len(internal), dtype=bool)
+    while True:
+        dead_ends = (A @ keep) == 1
+        removed = keep & (A.T @ dead_ends > 0)
+        if not removed.any():
+            return internal[keep]
+        keep &= ~removed
+
+
+def is_loop_free(S, v, internal=None, tol=TOL):
+    '''
+    Check that the flux vector v has no internal cycle, i.e. that there is
+    no nonzero u >= 0 with S_int diag(sign(v)) u = 0 on the internal
+    reactions carrying flux.
+    '''
+    if internal is None:
+        internal = get_internal_reactions(S)
+    v = np.asarray(v, dtype=float)
+    active = internal[np.abs(v[internal]) > tol]
+    if len(active) == 0:
+        return True
+    A = sparse.csc_matrix(S)[:, active] @ \
+        sparse.diags(np.sign(v[active]))
+    A = A.tocsr()
+    lp = gurobipy.Model()
+    lp.Params.OutputFlag = 0
+    u = lp.addMVar(len(active), lb=0., ub=1., obj=1.)
+    lp.addMConstr(A, u, gurobipy.GRB.EQUAL, np.zeros(A.shape[0]))
+    lp.ModelSense = -1
+    lp.optimize()
+    return lp.Status == gurobipy.GRB.OPTIMAL and lp.ObjVal < tol
+
+
+class LooplessModel(object):
+    '''
+    The loop law MILP for a CompiledModel: a copy of its Gurobi model with
+    a free potential mu_m for every metabolite and a binary direction a_i
+    for every internal reaction that can take part in a cycle,
+
+        a_i = 1  ->  v_i >= 0,  -K <= G_i <= -1
+        a_i = 0  ->  v_i <= 0,   1 <= G_i <= K
+        G = S_loop^T mu
+
+    Reactions outside every cycle (see get_loop_candidates) need no binary.
+    '''
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.revision = compiled.revision
+        cobra = compiled.cobra
+        S = cobra['S']
+        self.internal = get_internal_reactions(S)
+        self.loop_rxns = get_loop_candidates(S, self.internal)
+        S_loop = sparse.csc_matrix(S)[:, self.loop_rxns]
+        mets = np.flatnonzero(np.diff(S_loop.tocsr().indptr) > 0)
+        S_loop = sparse.csc_matrix(S_loop[mets])
+
+        # flush the changes update() made to bounds and objective
+        compiled.lp.update()
+        milp = compiled.lp.copy()
+        milp.Params.OutputFlag = 0
+        milp.Params.DualReductions = 0
+        lpvars = milp.getVars()
+        a = milp.addVars(len(self.loop_rxns), vtype=gurobipy.GRB.BINARY)
+        mu = milp.addVars(len(mets), lb=-gurobipy.GRB.INFINITY)
+        for k, j in enumerate(self.loop_rxns):
+            v = lpvars[j]
+            milp.addGenConstrIndicator(a[k], True, v,
+                                       gurobipy.GRB.GREATER_EQUAL, 0.)
+            milp.addGenConstrIndicator(a[k], False, v,
+                                       gurobipy.GRB.LESS_EQUAL, 0.)
+            # G = S^T mu; a = 1 -> -K <= G <= -1, a = 0 -> 1 <= G <= K
+            start, end = S_loop.indptr[k], S_loop.indptr[k + 1]
+            expr = gurobipy.LinExpr(
+                S_loop.data[start:end].tolist(),
+                [mu[i] for i in S_loop.indices[start:end]])
+            expr.add(a[k], K + 1.)
+            milp.addLConstr(expr, gurobipy.GRB.LESS_EQUAL, K)
+            milp.addLConstr(expr, gurobipy.GRB.GREATER_EQUAL, 1.)
+        milp.update()
+        self.milp = milp
+        self.vars = lpvars
+        self.lb = cobra['lb'].copy()
+        self.ub = cobra['ub'].copy()
+        self.c = cobra['c'].copy()
+
+    def sync(self):
+        '''Copy the bounds of the compiled model that changed to the MILP.'''
+        cobra = self.compiled.cobra
+        changed = np.flatnonzero((cobra['lb'] != self.lb) |
+                                 (cobra['ub'] != self.ub))
+        variables = [self.vars[j] for j in changed]
+        self.milp.setAttr('LB', variables,
+                          [grb_bound(x) for x in cobra['lb'][changed]])
+        self.milp.setAttr('UB', variables,
+                          [grb_bound(x) for x in cobra['ub'][changed]])
+        self.lb[changed] = cobra['lb'][changed]
+        self.ub[changed] = cobra['ub'][changed]
+
+    def optimize(self, f=None, precheck=True):
+        '''
+        Maximise f (default: the model objective) subject to the loop law
+        and return v, f_opt, conv as easy_lp does, with f_opt = INF if
+        unbounded. With precheck, the LP is solved first and its optimum
+        returned when it is already loop-free.
+        '''
+        compiled = self.compiled
+        cobra = compiled.cobra
+        if f is None:
+            f = cobra['c']
+        self.sync()
+
+        if precheck:
+            set_objective(compiled.lp, compiled.lpvars, cobra['c'], f)
+            try:
+                v, f_opt, conv = solve_lp(compiled.lp)
+            finally:
+                set_objective(compiled.lp, compiled.lpvars, f, cobra['c'])
+            if conv and is_loop_free(cobra['S'], v, self.internal):
+                return v, f_opt, conv
+
+        set_objective(self.milp, self.vars, self.c, f)
+        self.c = np.array(f, dtype=float)
+        self.milp.optimize()
+        v = np.empty(len(self.vars))
+        v[:] = NAN
+        f_opt = NAN
+        conv = False
+        if self.milp.Status == gurobipy.GRB.OPTIMAL:
+            f_opt = self.milp.ObjVal + 0.  # no -0.0
+            conv = True
+            v = [var.x for var in self.vars]
+        elif self.milp.Status == gurobipy.GRB.UNBOUNDED:
+            f_opt = INF
+        return v, f_opt, conv
+
+
+def set_objective(model, variables, old, new):
+    '''Set the Obj attribute of the variables where new differs from old.'''
+    changed = np.flatnonzero(np.asarray(new) != np.asarray(old))
+    model.setAttr('Obj', [variables[j] for j in changed],
+                  np.asarray(new, dtype=float)[changed].tolist())
+
+
+def get_loopless_model(sbml, bound=INF):
+    '''
+    Return the LooplessModel of sbml, building the MILP on first use or
+    after a change to the stoichiometry.
+    '''
+    compiled = get_compiled_model(sbml, bound)
+    loopless = _loopless_models.get(sbml)
+    if loopless is None or loopless.compiled is not compiled or \
+            loopless.revision != compiled.revision:
+        loopless = LooplessModel(compiled)
+        _loopless_models.set(sbml, loopless)
+    return loopless
+
+
+def release_loopless_model(sbml):
+    '''Drop the LooplessModel of sbml, if any.'''
+    _loopless_models.pop(sbml)
+
+
+def loopless_fba(sbml, bound=INF, precheck=True):
+    '''
+    Loopless version of optimize_cobra_model: return v_sol, f_opt for the
+    current bounds and objective of sbml.
+    '''
+    loopless = get_loopless_model(sbml, bound)
+    v_sol, f_opt, _ = loopless.optimize(precheck=precheck)
+    return v_sol, f_opt
+
+
+def loopless_fva(sbml, rxn_name_list=None, fraction=1., bound=INF,
+                 precheck=True):
+    '''
+    Loopless flux variability analysis: return the minimum and maximum
+    loopless flux of each reaction (default: all) with the objective held
+    at or above fraction times its loopless optimum.
+    '''
+    loopless = get_loopless_model(sbml, bound)
+    compiled = loopless.compiled
+    if rxn_name_list is None:
+        indices = list(range(len(compiled.rIDs)))
+    else:
+        if isinstance(rxn_name_list, str):
+            rxn_name_list = [rxn_name_list]
+        indices = []
+        for rID in rxn_name_list:
+            reaction = get_reaction_by_id(sbml, rID)
+            if not reaction:
+                print('reaction %s not found' % rID)
+            else:
+                indices.append(compiled.rxn_index[reaction.getId()])
+    minimum = np.empty(len(indices))
+    maximum = np.empty(len(indices))
+    minimum[:], maximum[:] = NAN, NAN
+
+    _, f_opt, conv = loopless.optimize(precheck=precheck)
+    if not conv:
+        return minimum, maximum
+
+    # hold the objective near its optimum in both the LP and the MILP
+    c = compiled.cobra['c']
+    nz = np.flatnonzero(c)
+    constrs = []
+    for model, variables in [(compiled.lp, compiled.lpvars),
+                             (loopless.milp, loopless.vars)]:
+        expr = gurobipy.LinExpr(c[nz].tolist(), [variables[j] for j in nz])
+        constrs.append((model, model.addLConstr(
+            expr, gurobipy.GRB.GREATER_EQUAL, fraction * f_opt - TOL)))
+    try:
+        for k, j in enumerate(indices):
+            f = np.zeros(len(c))
+            f[j] = 1.
+            maximum[k] = loopless.optimize(f, precheck)[1]
+            f[j] = -1.
+            minimum[k] = 0. - loopless.optimize(f, precheck)[1]
+    finally:
+        for model, constr in constrs:
+            model.remove(constr)
+            model.update()
+    return minimum, maximum
@@ -0,0 +1,243 @@
+"""
+Media definitions: load media from CSV or YAML, compile them against the
+exchange reactions of a model into index / bound arrays, and apply them to a
+compiled model in one step. Perturbed media (drop one or add one nutrient)
+are compiled as deltas on a base medium and can be solved in parallel.
+
+CSV files have the columns medium,reaction,uptake; YAML files map medium
+names to {reaction: uptake}. Uptake rates are positive, inf for unlimited.
+"""
+
+import csv
+import multiprocessing
+import os
+
+import numpy as np
+
+from metabolicModeling import INF, get_compiled_model, get_reaction_by_id, \
+    grb_bound, objective_vector, optimize_objectives
+from shared_model import init_worker, share_model, worker_model
+
+
+def load_media(filename):
+    '''
+    Read media definitions from a .csv or .yaml/.yml file and return them as
+    {medium: {reaction ID: uptake}}.
+    '''
+    extension = os.path.splitext(filename)[1].lower()
+    media = {}
+    if extension == '.csv':
+        with open(filename) as f:
+            for row in csv.DictReader(f):
+                media.setdefault(row['medium'], {})[row['reaction']] = \
+                    float(row['uptake'])
+    elif extension in ['.yaml', '.yml']:
+        import yaml
+        with open(filename) as f:
+            for name, medium in yaml.safe_load(f).items():
+                media[name] = dict((rID, float(uptake))
+                                   for rID, uptake in medium.items())
+    else:
+        raise ValueError('unknown media file format %s' % extension)
+    return media
+
+
+def get_exchange_reactions(compiled):
+    '''
+    Return the columns of the import reactions of a compiled model and
+    whether they import through their lower bound (one substrate, no
+    product) rather than their upper bound (one product, no substrate), as
+    in block_all_imports.
+    '''
+    S = compiled.cobra['S'].tocsc()
+    nR = np.asarray((S < 0).sum(axis=0)).ravel()
+    nP = np.asarray((S > 0).sum(axis=0)).ravel()
+    through_lb = (nR == 1) & (nP == 0)
+    through_ub = (nR == 0) & (nP == 1)
+    index = np.flatnonzero(through_lb | through_ub)
+    return index, through_lb[index]
+
+
+def compile_medium(sbml, medium, bound=INF):
+    '''
+    Compile a medium {reaction ID: uptake} into the bounds of every import
+    reaction of sbml: blocked unless in the medium, open at the uptake
+    otherwise. Returns {'index', 'lb', 'ub'} arrays over the model columns.
+    '''
+    compiled = get_compiled_model(sbml, bound)
+    index, through_lb = get_exchange_reactions(compiled)
+    position = dict((j, k) for k, j in enumerate(index))
+    return _compile_medium(sbml, compiled, medium, index, through_lb,
+                           position, bound)
+
+
+def _compile_medium(sbml, compiled, medium, index, through_lb, position,
+                    bound):
+    cobra = compiled.cobra
+    lb, ub = cobra['lb'][index].copy(), cobra['ub'][index].copy()
+    lb[through_lb] = 0.
+    ub[~through_lb] = 0.
+    for rID, uptake in medium.items():
+        k = _import_position(sbml, compiled, position, rID)
+        if k is None:
+            continue
+        if through_lb[k]:
+            lb[k] = max(-abs(uptake), -bound)
+        else:
+            ub[k] = min(abs(uptake), bound)
+    return {'index': index, 'lb': lb, 'ub': ub}
+
+
+def _import_position(sbml, compiled, position, rID):
+    # position of reaction rID among the import reactions, or None
+    reaction = get_reaction_by_id(sbml, rID)
+    if not reaction:
+        print('reaction %s not found' % rID)
+        return None
+    k = position.get(compiled.rxn_index[reaction.getId()])
+    if k is None:
+        print('reaction %s not import' % rID)
+    return k
+
+
+def medium_perturbations(sbml, medium, uptake=INF, candidates=None,
+                         bound=INF):
+    '''
+    Return (names, deltas) for the drop-one and add-one perturbations of a
+    medium: each delta is {'index', 'lb', 'ub'} for the single import
+    reaction that changes with respect to compile_medium(sbml, medium).
+    Nutrients are added at uptake, from candidates (default: every import
+    reaction not in the medium). The deltas are built from the compiled
+    base medium, without compiling each perturbed medium.
+    '''
+    compiled = get_compiled_model(sbml, bound)
+    index, through_lb = get_exchange_reactions(compiled)
+    position = dict((j, k) for k, j in enumerate(index))
+    base = _compile_medium(sbml, compiled, medium, index, through_lb,
+                           position, bound)
+    dropped = [_import_position(sbml, compiled, position, rID)
+               for rID in medium]
+    if candidates is None:
+        in_medium = set(dropped)
+        added = [k for k in range(len(index)) if k not in in_medium]
+        candidates = [compiled.rIDs[index[k]] for k in added]
+    else:
+        added = [_import_position(sbml, compiled, position, rID)
+                 for rID in candidates]
+
+    # every import blocked, or every import opened at uptake
+    blocked = {'lb': np.where(through_lb, 0., base['lb']),
+               'ub': np.where(through_lb, base['ub'], 0.)}
+    opened = {'lb': np.where(through_lb, max(-abs(uptake), -bound),
+                             base['lb']),
+              'ub': np.where(through_lb, base['ub'],
+                             min(abs(uptake), bound))}
+    names = ['-' + rID for rID in medium] + ['+' + rID for rID in candidates]
+    deltas = [_delta(base, blocked, k) for k in dropped] + \
+        [_delta(base, opened, k) for k in added]
+    return names, deltas
+
+
+def _delta(base, perturbed, k):
+    # the bounds of import k in perturbed, if they differ from base
+    if k is None or (perturbed['lb'][k] == base['lb'][k] and
+                     perturbed['ub'][k] == base['ub'][k]):
+        k = slice(0, 0)
+    else:
+        k = slice(k, k + 1)
+    return {'index': base['index'][k],
+            'lb': perturbed['lb'][k],
+            'ub': perturbed['ub'][k]}
+
+
+def apply_bounds(compiled, bounds):
+    '''
+    Set the bounds {'index', 'lb', 'ub'} (a compiled medium or a delta) on
+    the arrays and the Gurobi model of a compiled model, and return the
+    bounds they replace, for undoing the change. The SBML document is not
+    modified.
+    '''
+    cobra = compiled.cobra
+    index = bounds['index']
+    previous = {'index': index,
+                'lb': cobra['lb'][index].copy(),
+                'ub': cobra['ub'][index].copy()}
+    cobra['lb'][index] = bounds['lb']
+    cobra['ub'][index] = bounds['ub']
+    variables = [compiled.lpvars[j] for j in index]
+    compiled.lp.setAttr('LB', variables, [grb_bound(x) for x in bounds['lb']])
+    compiled.lp.setAttr('UB', variables, [grb_bound(x) for x in bounds['ub']])
+    return previous
+
+
+def solve_media(sbml, media, objectives, bound=INF):
+    '''
+    Return the media x objectives array of solve_objectives values, for a
+    list of media {reaction ID: uptake} or compiled media.
+    '''
+    compiled = get_compiled_model(sbml, bound)
+    vectors = [objective_vector(sbml, compiled, objective)
+               for objective in objectives]
+    f_opt = np.empty((len(media), len(objectives)))
+    for i, medium in enumerate(media):
+        if 'index' not in medium:
+            medium = compile_medium(sbml, medium, bound)
+        compiled = get_compiled_model(sbml, bound)
+        previous = apply_bounds(compiled, medium)
+        try:
+            f_opt[i] = optimize_objectives(compiled, vectors)
+        finally:
+            apply_bounds(compiled, previous)
+    return f_opt
+
+
+def solve_perturbations(sbml, medium, deltas, objectives, processes=1,
+                        bound=INF):
+    '''
+    Return the deltas x objectives array of solve_objectives values for
+    perturbations of a medium (see medium_perturbations). With more than
+    one process, the deltas are split across a pool of workers attached to
+    a shared-memory copy of the model (see shared_model).
+    '''
+    if 'index' not in medium:
+        medium = compile_medium(sbml, medium, bound)
+    compiled = get_compiled_model(sbml, bound)
+    vectors = [objective_vector(sbml, compiled, objective)
+               for objective in objectives]
+    if processes == 1 or len(deltas) < 2:
+        return _solve_deltas(compiled, medium, deltas, vectors)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    chunks = [deltas[k::processes] for k in range(processes)]
+    with share_model(sbml, bound) as shared:
+        pool = multiprocessing.Pool(processes, init_worker, (shared.handle,))
+        try:
+            results = pool.map(_solve_worker_chunk,
+                               [(medium, chunk, vectors) for chunk in chunks])
+        finally:
+            pool.close()
+            pool.join()
+    f_opt = np.empty((len(deltas), len(objectives)))
+    for k, result in enumerate(results):
+        f_opt[k::processes] = result
+    return f_opt
+
+
+def _solve_deltas(compiled, medium, deltas, vectors):
+    f_opt = np.empty((len(deltas), len(vectors)))
+    base = apply_bounds(compiled, medium)
+    try:
+        for i, delta in enumerate(deltas):
+            previous = apply_bounds(compiled, delta)
+            try:
+                f_opt[i] = optimize_objectives(compiled, vectors)
+            finally:
+                apply_bounds(compiled, previous)
+    finally:
+        apply_bounds(compiled, base)
+    return f_opt
+
+
+def _solve_worker_chunk(args):
+    medium, deltas, vectors = args
+    return _solve_deltas(worker_model(), medium, deltas, vectors)
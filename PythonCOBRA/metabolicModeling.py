@@ -2,13 +2,17 @@
 
 """
 
-import itertools
+import multiprocessing
 import numpy as np
 import os
 import re
-import gurobipy as gpy
+import weakref
+import gurobipy
 import libsbml
-import scipy
+from scipy import sparse
+
+INF = float('inf')
+NAN = float('nan')
 
 def readSBML(filename):
     '''
@@ -19,149 +23,221 @@ def readSBML(filename):
     sbml = reader.readSBMLFromFile(filename)
     model = sbml.getModel()
 
-    S = scipy.sparse.lil_matrix((model.getNumSpecies(),
-                                 model.getNumReactions()))
-    lb, ub, c, b, rev, sIDs = [], [], [], [], [], []
-
+    COBRA = convert_sbml_to_cobra(sbml, INF)
+    rxns, grRules = [], []
+    for reaction in model.getListOfReactions():
+        rxns.append(reaction.getId())
+        grRules.append(read_notes_field(reaction, 'GENE_ASSOCIATION'))
+    mets, metFormulas, metCharge, metBoundary = [], [], [], []
     for species in model.getListOfSpecies():
-        sIDs.append(species.getId())
-        b.append(0.0)
-
-    sIDs = [species.getId() for species in model.getListOfSpecies()]
-
-    rxnID = []
-    for j, reaction in enumerate(model.getListOfReactions()):
-        rxnID.append(reaction)
-        for reactant in reaction.getListOfReactants():
-            sID = reactant.getSpecies()
-            s = reactant.getStoichiometry()
-
-            if not model.getSpecies(sID).getBoundaryCondition():
-                i = sIDs.index(sID)
-                S[i, j] = S[i, j] - s
-
-        for product in reaction.getListOfProducts():
-            sID = product.getSpecies()
-            s = product.getStoichiometry()
-
-            if not model.getSpecies(sID).getBoundaryCondition():
-                i = sIDs.index(sID)
-                S[i, j] = S[i, j] + s
-
-        kinetic_law = reaction.getKineticLaw()
-        rxn_lb = kinetic_law.getParameter('LOWER_BOUND').getValue()
-        rxn_ub = kinetic_law.getParameter('UPPER_BOUND').getValue()
-        rxn_c = kinetic_law.getParameter('OBJECTIVE_COEFFICIENT').getValue()
-        rxn_rev = reaction.getReversible()
-
-        lb.append(rxn_lb)
-        ub.append(rxn_ub)
-        c.append(rxn_c)
-        rev.append(rxn_rev)
-
-    lb, ub, c, b, rev = numpy.array(lb), \
-                        numpy.array(ub), \
-                        numpy.array(c),\
-                        numpy.array(b), \
-                        numpy.array(rev)
-    rxns = np.chararray()
-    COBRA = {'rxns': rxns,
-             'mets': mets,
-             'S': S,
-             'lb': lb,
-             'ub': ub,
-             'c': c,
-             'b': b,
-             'rev': rev,
-             'metCharge': metCharge,
-             }
+        mets.append(species.getId())
+        metFormulas.append(read_notes_field(species, 'FORMULA'))
+        metBoundary.append(species.getBoundaryCondition())
+        charge = read_notes_field(species, 'CHARGE')
+        if species.isSetCharge():
+            metCharge.append(species.getCharge())
+        elif charge:
+            metCharge.append(float(charge))
+        else:
+            metCharge.append(NAN)
+
+    COBRA.update({'rxns': np.array(rxns),
+                  'mets': np.array(mets),
+                  'grRules': grRules,
+                  'metFormulas': metFormulas,
+                  'metCharge': np.array(metCharge, dtype=float),
+                  'metBoundary': np.array(metBoundary, dtype=bool),
+                  })
     return COBRA
 
-def modelSummary(sbml, displayErrors=False):
+
+def modelSummary(sbml, display_errors=False):
     '''
     Print the statistics on the number and type of species / reactions / genes in a constraint-based metabolic
-    model
+    model, and return them as computed by model_statistics
     '''
-    model = sbml.getModel()
+    stats = model_statistics(sbml)
 
     # species statistics by SBO term
-    print '\n%g\t%s' % (model.getNumSpecies(), 'species')
-    sbo_count = {}
-    for species in model.getListOfSpecies():
-        sbo = species.getSBOTerm()
-        if sbo not in sbo_count:
-            sbo_count[sbo] = 0
-        sbo_count[sbo] += 1
-        if display_errors and (sbo == -1):
-            print '%s\t%s\t%s' % ('species', species.getId(),
-                                  'has no SBO term')
-    for sbo in sorted(sbo_count.keys()):
-        print '%g\t%s\t%g' % (sbo_count[sbo], 'with SBO term', sbo)
+    print('\n%g\t%s' % (stats['species'], 'species'))
+    if display_errors:
+        for sID in stats['species_without_sbo']:
+            print('%s\t%s\t%s' % ('species', sID, 'has no SBO term'))
+    for sbo in sorted(stats['species_sbo'].keys()):
+        print('%g\t%s\t%g' % (stats['species_sbo'][sbo], 'with SBO term',
+                               sbo))
 
     # species statistics by type
-    appears_in_reaction = []
-    for reaction in model.getListOfReactions():
-        for reactant in itertools.chain(reaction.getListOfReactants(),
-                                        reaction.getListOfProducts()):
-            sID = reactant.getSpecies()
-            if sID not in appears_in_reaction:
-                appears_in_reaction.append(sID)
-    nM, nB, nE = 0, 0, 0
-    for species in model.getListOfSpecies():
-        if species.getId() not in appears_in_reaction:
-            nE += 1
-        elif species.getBoundaryCondition():
-            nB += 1
-        else:
-            nM += 1
-    print '%g\t%s' % (nM, 'variable')
-    print '%g\t%s' % (nB, 'fixed')
-    print '%g\t%s' % (nE, 'non-reactants')
+    print('%g\t%s' % (stats['variable'], 'variable'))
+    print('%g\t%s' % (stats['fixed'], 'fixed'))
+    print('%g\t%s' % (stats['non_reactants'], 'non-reactants'))
 
     # reaction statistics by SBO term
-    print '\n%g\t%s' % (model.getNumReactions(), 'reactions')
-    sbo_count = {}
-    for reaction in model.getListOfReactions():
-        sbo = reaction.getSBOTerm()
-        if sbo not in sbo_count:
-            sbo_count[sbo] = 0
-        sbo_count[sbo] += 1
-        if display_errors and (sbo == -1):
-            print '%s\t%s\t%s' % ('reaction', reaction.getId(),
-                                  'has no SBO term')
-    for sbo in sorted(sbo_count.keys()):
-        print '%g\t%s\t%g' % (sbo_count[sbo], 'with SBO term', sbo)
+    print('\n%g\t%s' % (stats['reactions'], 'reactions'))
+    if display_errors:
+        for rID in stats['reactions_without_sbo']:
+            print('%s\t%s\t%s' % ('reaction', rID, 'has no SBO term'))
+    for sbo in sorted(stats['reaction_sbo'].keys()):
+        print('%g\t%s\t%g' % (stats['reaction_sbo'][sbo], 'with SBO term',
+                               sbo))
 
     # reaction statistics by type
-    nB = 0
-    rID_list = get_source_reactions(sbml)
-    print '%g\t%s' % (model.getNumReactions() - len(rID_list),
-                      'non-source/sink')
-    print '%g\t%s' % (len(rID_list), 'source/sink')
+    print('%g\t%s' % (stats['non_source_sink'], 'non-source/sink'))
+    print('%g\t%s' % (stats['source_sink'], 'source/sink'))
 
     # number of genes
-    gene_list = get_list_of_genes(sbml)
-    print '\n%g\t%s' % (len(gene_list), 'genes')
+    print('\n%g\t%s' % (stats['genes'], 'genes'))
+    return stats
 
 
-def printGeneList(sbml):
+def model_statistics(sbml):
+    '''
+    Return the statistics printed by modelSummary as a dictionary, computed
+    in a single pass over the model.
+    '''
+    model = sbml.getModel()
+    arrays = get_model_arrays(sbml)
+    species_sbo, reaction_sbo = arrays['species_sbo'], arrays['reaction_sbo']
+    boundary = arrays['boundary']
+    ref_rxn, ref_species = arrays['ref_rxn'], arrays['ref_species']
+    ref_product = arrays['ref_product']
+    nS, nR = len(species_sbo), len(reaction_sbo)
+
+    # species statistics by type: 0 variable, 1 fixed, 2 non-reactant
+    appears_in_reaction = np.zeros(nS, dtype=bool)
+    appears_in_reaction[ref_species] = True
+    species_type = np.where(appears_in_reaction, boundary.astype(int), 2)
+    nM, nB, nE = np.bincount(species_type, minlength=3)
+
+    # reaction statistics by type, as in get_source_reactions
+    source_boundary = boundary.copy()
+    carbon = arrays['species_index'].get('M_carbon_e')
+    if carbon is not None:
+        source_boundary[carbon] = True
+    internal = ~source_boundary[ref_species]
+    nSub = np.bincount(ref_rxn[internal & ~ref_product], minlength=nR)
+    nProd = np.bincount(ref_rxn[internal & ref_product], minlength=nR)
+    n_source = int(np.count_nonzero((nSub == 0) | (nProd == 0)))
+
+    species_ids = np.array(arrays['sIDs'], dtype=object)
+    reaction_ids = np.array(arrays['rIDs'], dtype=object)
+    return {'model': model.getId(),
+            'species': nS,
+            'species_sbo': sbo_histogram(species_sbo),
+            'species_without_sbo': list(species_ids[species_sbo == -1]),
+            'variable': int(nM),
+            'fixed': int(nB),
+            'non_reactants': int(nE),
+            'reactions': nR,
+            'reaction_sbo': sbo_histogram(reaction_sbo),
+            'reactions_without_sbo': list(reaction_ids[reaction_sbo == -1]),
+            'non_source_sink': nR - n_source,
+            'source_sink': n_source,
+            'genes': len(arrays['genes']),
+            }
+
+
+def sbo_histogram(sbo):
+    '''Count the occurrences of each SBO term in an integer array.'''
+    terms, counts = np.unique(sbo, return_counts=True)
+    return dict((int(t), int(n)) for t, n in zip(terms, counts))
+
+
+def get_model_arrays(sbml):
+    '''
+    Read the species and reaction annotations of a model into arrays:
+    SBO terms, boundary flags, the species / reaction / product flag of
+    every species reference (boundary species included), and the genes.
+    '''
+    model = sbml.getModel()
+    sIDs, species_sbo, boundary = [], [], []
+    for species in model.getListOfSpecies():
+        sIDs.append(species.getId())
+        species_sbo.append(species.getSBOTerm())
+        boundary.append(species.getBoundaryCondition())
+    species_index = dict((sID, i) for i, sID in enumerate(sIDs))
+
+    rIDs, reaction_sbo, ref_rxn, ref_species, ref_product = [], [], [], [], []
+    genes = set()
+    for j, reaction in enumerate(model.getListOfReactions()):
+        rIDs.append(reaction.getId())
+        reaction_sbo.append(reaction.getSBOTerm())
+        for reactant in reaction.getListOfReactants():
+            ref_rxn.append(j)
+            ref_species.append(species_index[reactant.getSpecies()])
+            ref_product.append(False)
+        for product in reaction.getListOfProducts():
+            ref_rxn.append(j)
+            ref_species.append(species_index[product.getSpecies()])
+            ref_product.append(True)
+        genes.update(get_genes(read_notes_field(reaction,
+                                                'GENE_ASSOCIATION')))
+
+    return {'sIDs': sIDs,
+            'rIDs': rIDs,
+            'species_index': species_index,
+            'species_sbo': np.array(species_sbo, dtype=int),
+            'boundary': np.array(boundary, dtype=bool),
+            'reaction_sbo': np.array(reaction_sbo, dtype=int),
+            'ref_rxn': np.array(ref_rxn, dtype=int),
+            'ref_species': np.array(ref_species, dtype=int),
+            'ref_product': np.array(ref_product, dtype=bool),
+            'genes': genes,
+            }
+
+
+def model_statistics_from_file(filename):
+    '''Read an SBML file and return its model_statistics.'''
+    sbml = libsbml.SBMLReader().readSBMLFromFile(filename)
+    return model_statistics(sbml)
+
+
+def summarize_models(model_path=None, processes=None):
+    '''
+    Return {model name: model_statistics} for every model in model_path
+    (see list_models), reading and summarizing the models in parallel.
+    '''
+    model_names, model_path = list_models(model_path)
+    filenames = [os.path.join(model_path, name + '.xml')
+                 for name in model_names]
+    pool = multiprocessing.Pool(processes)
+    try:
+        stats = pool.map(model_statistics_from_file, filenames)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(model_names, stats))
+
+
+def get_list_of_genes(sbml):
     '''
     Return list of all genes in model
     '''
     model = sbml.getModel()
-    geneList = []
+    gene_list = set()
     for reaction in model.getListOfReactions():
-        reactionID = reaction.getId()
-        gene_association = get_notes_field(rID, 'GENE_ASSOCIATION', sbml)
-        new_genes = re.findall(r'\b\S+\b', gene_association)
-        gene_list.extend(new_genes)
-    gene_list = list(set(geneList).difference(['and', 'or', 'AND', 'OR']))
+        gene_association = read_notes_field(reaction, 'GENE_ASSOCIATION')
+        gene_list.update(get_genes(gene_association))
     return sorted(gene_list)
 
 
+def get_genes(gene_association):
+    '''Return the set of genes in a gene association string.'''
+    genes = set(re.findall(r'\b\S+\b', gene_association))
+    return genes.difference(['and', 'or', 'AND', 'OR'])
+
+
+def printGeneList(sbml):
+    '''
+    Return list of all genes in model
+    '''
+    return get_list_of_genes(sbml)
+
+
 def model_balancing(sbml, display_errors=False):
     '''
-    Checks elemental balancing for all reactions in model
+    Checks elemental balancing for all reactions in model, and returns the
+    number of balanced, unbalanced and unknown reactions
     '''
     model = sbml.getModel()
     rID_list = get_source_reactions(sbml)  # list of source/sink reactions
@@ -174,22 +250,25 @@ def model_balancing(sbml, display_errors=False):
             if unknown:
                 num_unknown += 1
                 if display_errors:
-                    print '\n%s\t%s\t%s\t[%s]' % ('reaction', rID, 'unknown',
-                                                  formula)
+                    print('\n%s\t%s\t%s\t[%s]' % ('reaction', rID, 'unknown',
+                                                   formula))
             elif formula:
                 num_imbalanced += 1
                 if display_errors:
-                    print '\n%s\t%s\t%s\t[%s]' % ('reaction', rID,
-                                                  'unbalanced', formula)
+                    print('\n%s\t%s\t%s\t[%s]' % ('reaction', rID,
+                                                   'unbalanced', formula))
             else:
                 num_balanced += 1
             if display_errors and (unknown or formula):
-                print display_reaction_and_formula(rID, sbml)
+                print(display_reaction_and_formula(rID, sbml))
 
-    print ''
-    print '%g\t%s' % (num_balanced, 'reactions balanced')
-    print '%g\t%s' % (num_imbalanced, 'reactions unbalanced')
-    print '%g\t%s' % (num_unknown, 'reactions unknown')
+    print('')
+    print('%g\t%s' % (num_balanced, 'reactions balanced'))
+    print('%g\t%s' % (num_imbalanced, 'reactions unbalanced'))
+    print('%g\t%s' % (num_unknown, 'reactions unknown'))
+    return {'balanced': num_balanced,
+            'unbalanced': num_imbalanced,
+            'unknown': num_unknown}
 
 
 def get_source_reactions(sbml):
@@ -200,8 +279,9 @@ def get_source_reactions(sbml):
 
     # strip out format used in recon 2.1
     species = model.getSpecies('M_carbon_e')
-    if species:
+    if species and not species.getBoundaryCondition():
         species.setBoundaryCondition(True)
+        mark_structure_changed(sbml)
 
     for reaction in model.getListOfReactions():
         nS, nP = 0, 0
@@ -219,15 +299,16 @@ def get_source_reactions(sbml):
     return rID_list
 
 
-def list_models():
+def list_models(model_path=None):
     '''
     model_names, model_path = list_models()
     returns
-    model_names: list of SBML models in the directory ../models
-    model_path: the full path to the directory ../models
+    model_names: list of SBML models in model_path (default ../models)
+    model_path: the full path to the model directory
     '''
-    tests_path = os.path.dirname(__file__)
-    model_path = os.path.join(tests_path, '..', 'models')
+    if model_path is None:
+        tests_path = os.path.dirname(__file__)
+        model_path = os.path.join(tests_path, '..', 'models')
     model_path = os.path.normpath(model_path)
     model_names = []
     for filename in os.listdir(model_path):
@@ -256,7 +337,7 @@ def max_fluxes(sbml):
         'EX_pi(e)'
     ]
     objective_mat = ['DM_atp_c_','HXPRT','OMPDC','PSP_L','AIRCr_PRASCS']
-    print ''
+    print('')
 
     for normoxic in [True, False]:
         for carbon_source in [
@@ -299,17 +380,41 @@ def max_fluxes(sbml):
                 #'EX_tyr_L(e)',
                 #'EX_val_L(e)',
         ]:
-            for objective in objective_mat:
-                f_opt = max_flux(sbml, carbon_source, objective, normoxic, media)
-                print '%s (%s): %s \t%g' % (carbon_source,
+            f_opt = max_flux_matrix(sbml, [carbon_source], objective_mat,
+                                    normoxic, media)[0]
+            for objective, f in zip(objective_mat, f_opt):
+                print('%s (%s): %s \t%g' % (carbon_source,
                                     'normoxic' if normoxic else 'anaerobic', objective,
-                                    f_opt)
+                                    f))
 
 
 def max_flux(sbml, carbon_source, objective, normoxic, media):
     '''
     Written to mimic neilswainston matlab function maxFlux
     '''
+    return max_flux_matrix(sbml, [carbon_source], [objective], normoxic,
+                           media)[0, 0]
+
+
+def max_flux_matrix(sbml, carbon_sources, objectives, normoxic, media):
+    '''
+    Maximise every objective on every carbon source and return the optimal
+    values as a carbon_sources x objectives array (see solve_objectives).
+    Each medium is applied once and its objectives are solved back to back
+    on the same Gurobi model.
+    '''
+    f_opt = np.empty((len(carbon_sources), len(objectives)))
+    for i, carbon_source in enumerate(carbon_sources):
+        set_medium(sbml, carbon_source, normoxic, media)
+        f_opt[i] = solve_objectives(sbml, objectives)
+    return f_opt
+
+
+def set_medium(sbml, carbon_source, normoxic, media):
+    '''
+    Open the carbon source (at 1), the media and, if normoxic, oxygen (at
+    INF), and block all other imports
+    '''
     set_infinite_bounds(sbml)
     # block import reactions
     block_all_imports(sbml)
@@ -319,16 +424,81 @@ def max_flux(sbml, carbon_source, objective, normoxic, media):
     set_import_bounds(sbml, media, INF)
     if normoxic:
         set_import_bounds(sbml, 'EX_o2(e)', INF)
-    # specify objective and maximise
-    change_objective(sbml, objective)
-    # avoid infinities
-    obj_max = 1e6
-    change_rxn_bounds(sbml, objective, obj_max, 'u')
-    _, f_opt = optimize_cobra_model(sbml)
-    if f_opt > 0.9 * obj_max:
-        f_opt = INF
+
+
+def solve_objectives(sbml, objectives, bound=INF):
+    '''
+    Maximise each objective in turn on the compiled model of sbml and return
+    the optimal values as an array: INF where the objective is unbounded and
+    NAN where the model is infeasible. An objective is a reaction ID, a
+    dictionary {reaction ID: coefficient} or a vector over the reactions.
+    Only the objective and the upper bounds of its reactions, which are
+    opened to INF as in maxFlux, are changed between solves; the SBML
+    document is left untouched.
+    '''
+    compiled = get_compiled_model(sbml, bound)
+    vectors = [objective_vector(sbml, compiled, objective)
+               for objective in objectives]
+    return optimize_objectives(compiled, vectors)
+
+
+def optimize_objectives(compiled, vectors):
+    '''
+    Maximise each objective vector in turn on a compiled model, or on any
+    object with the same cobra, lp and lpvars attributes (see
+    shared_model.SharedModel); see solve_objectives.
+    '''
+    lp, lpvars, cobra = compiled.lp, compiled.lpvars, compiled.cobra
+    f_opt = np.empty(len(vectors))
+    f_opt[:] = NAN
+    # report UNBOUNDED rather than INF_OR_UNBD
+    lp.Params.DualReductions = 0
+    current = cobra['c']
+    opened = []
+    try:
+        for k, f in enumerate(vectors):
+            changed = np.flatnonzero(f != current)
+            lp.setAttr('Obj', [lpvars[j] for j in changed],
+                       f[changed].tolist())
+            current = f
+            opened = [lpvars[j] for j in np.flatnonzero(f)]
+            lp.setAttr('UB', opened, [gurobipy.GRB.INFINITY] * len(opened))
+            lp.optimize()
+            if lp.Status == gurobipy.GRB.OPTIMAL:
+                f_opt[k] = lp.ObjVal + 0.  # no -0.0
+            elif lp.Status == gurobipy.GRB.UNBOUNDED:
+                f_opt[k] = INF
+            lp.setAttr('UB', opened, [grb_bound(cobra['ub'][var.index])
+                                      for var in opened])
+            opened = []
+    finally:
+        lp.setAttr('UB', opened, [grb_bound(cobra['ub'][var.index])
+                                  for var in opened])
+        changed = np.flatnonzero(cobra['c'] != current)
+        lp.setAttr('Obj', [lpvars[j] for j in changed],
+                   cobra['c'][changed].tolist())
+        lp.Params.DualReductions = 1
     return f_opt
 
+
+def objective_vector(sbml, compiled, objective):
+    '''
+    Return objective (reaction ID, {reaction ID: coefficient} or vector) as
+    a vector over the reactions of the compiled model.
+    '''
+    if isinstance(objective, str):
+        objective = {objective: 1.}
+    if not isinstance(objective, dict):
+        return np.asarray(objective, dtype=float)
+    f = np.zeros(len(compiled.rIDs))
+    for rID, coeff in objective.items():
+        reaction = get_reaction_by_id(sbml, rID)
+        if not reaction:
+            print('reaction %s not found' % rID)
+        else:
+            f[compiled.rxn_index[reaction.getId()]] = coeff
+    return f
+
 def block_all_imports(sbml):
     '''
     Written to mimic neilswainston matlab function blockAllImports
@@ -346,11 +516,10 @@ def block_all_imports(sbml):
             sID = product.getSpecies()
             if not model.getSpecies(sID).getBoundaryCondition():
                 nP += 1
-        kineticLaw = reaction.getKineticLaw()
         if (nR == 1) and (nP == 0):
-            kineticLaw.getParameter('LOWER_BOUND').setValue(0)
+            set_rxn_parameter(sbml, reaction, 'LOWER_BOUND', 0)
         if (nR == 0) and (nP == 1):
-            kineticLaw.getParameter('UPPER_BOUND').setValue(0)
+            set_rxn_parameter(sbml, reaction, 'UPPER_BOUND', 0)
 
 
 def change_rxn_bounds(sbml, rxn_name_list, value, bound_type='b'):
@@ -361,20 +530,21 @@ def change_rxn_bounds(sbml, rxn_name_list, value, bound_type='b'):
     # convert single entries to lists
     if isinstance(rxn_name_list, str):
         rxn_name_list = [rxn_name_list]
-    if isinstance(value, (int, float, long, complex)):
+    if isinstance(value, (int, float, complex)):
         value = [value] * len(rxn_name_list)
     if isinstance(bound_type, str):
         bound_type = [bound_type] * len(rxn_name_list)
     for index, rID in enumerate(rxn_name_list):
         reaction = get_reaction_by_id(sbml, rID)
         if not reaction:
-            print 'reaction %s not found' % rID
+            print('reaction %s not found' % rID)
         else:
-            kineticLaw = reaction.getKineticLaw()
             if bound_type[index] in ['l', 'b']:
-                kineticLaw.getParameter('LOWER_BOUND').setValue(value[index])
+                set_rxn_parameter(sbml, reaction, 'LOWER_BOUND',
+                                  value[index])
             if bound_type[index] in ['u', 'b']:
-                kineticLaw.getParameter('UPPER_BOUND').setValue(value[index])
+                set_rxn_parameter(sbml, reaction, 'UPPER_BOUND',
+                                  value[index])
 
 
 def change_objective(sbml, rxn_name_list, objective_coeff=1):
@@ -384,21 +554,19 @@ def change_objective(sbml, rxn_name_list, objective_coeff=1):
     '''
     model = sbml.getModel()
     for reaction in model.getListOfReactions():
-        kineticLaw = reaction.getKineticLaw()
-        kineticLaw.getParameter('OBJECTIVE_COEFFICIENT').setValue(0)
+        set_rxn_parameter(sbml, reaction, 'OBJECTIVE_COEFFICIENT', 0)
     # convert single entries to lists
     if isinstance(rxn_name_list, str):
         rxn_name_list = [rxn_name_list]
-    if isinstance(objective_coeff, (int, float, long, complex)):
+    if isinstance(objective_coeff, (int, float, complex)):
         objective_coeff = [objective_coeff] * len(rxn_name_list)
     for index, rID in enumerate(rxn_name_list):
         reaction = get_reaction_by_id(sbml, rID)
         if not reaction:
-            print 'reaction %s not found' % rID
+            print('reaction %s not found' % rID)
         else:
-            kineticLaw = reaction.getKineticLaw()
-            kineticLaw.getParameter('OBJECTIVE_COEFFICIENT').setValue(
-                objective_coeff[index])
+            set_rxn_parameter(sbml, reaction, 'OBJECTIVE_COEFFICIENT',
+                              objective_coeff[index])
 
 
 def format_for_SBML_ID(txt):
@@ -431,12 +599,9 @@ def optimize_cobra_model(sbml):
     Replicate Cobra command optimizeCbModel(model,[],'one').
     '''
     bound = INF
-    cobra = convert_sbml_to_cobra(sbml, bound)
-
-    N, L, U = cobra['S'], list(cobra['lb']), list(cobra['ub'])
-    f, b = list(cobra['c']), list(cobra['b'])
-    v_sol, f_opt, _ = easy_lp(f, N, b, L, U, one=False)
-    print v_sol
+    compiled = get_compiled_model(sbml, bound)
+    v_sol, f_opt, _ = solve_lp(compiled.lp)
+    print(v_sol)
     return v_sol, f_opt
 
 
@@ -446,88 +611,75 @@ def convert_sbml_to_cobra(sbml, bound=INF):
     '''
     model = sbml.getModel()
     S = sparse.lil_matrix((model.getNumSpecies(), model.getNumReactions()))
-    lb, ub, c, b, rev, sIDs = [], [], [], [], [], []
-    for species in model.getListOfSpecies():
-        sIDs.append(species.getId())
-        b.append(0.)
-    sIDs = [species.getId() for species in model.getListOfSpecies()]
+    lb, ub, c, rev = [], [], [], []
+    species_index = get_species_index(sbml)
+    b = [0.] * len(species_index)
     for j, reaction in enumerate(model.getListOfReactions()):
-        for reactant in reaction.getListOfReactants():
-            sID = reactant.getSpecies()
-            s = reactant.getStoichiometry()
-            if not model.getSpecies(sID).getBoundaryCondition():
-                i = sIDs.index(sID)
-                S[i, j] = S[i, j] - s
-        for product in reaction.getListOfProducts():
-            sID = product.getSpecies()
-            s = product.getStoichiometry()
-            if not model.getSpecies(sID).getBoundaryCondition():
-                i = sIDs.index(sID)
-                S[i, j] = S[i, j] + s
-        kinetic_law = reaction.getKineticLaw()
-        rxn_lb = kinetic_law.getParameter('LOWER_BOUND').getValue()
-        rxn_ub = kinetic_law.getParameter('UPPER_BOUND').getValue()
-        rxn_c = kinetic_law.getParameter('OBJECTIVE_COEFFICIENT').getValue()
-        rxn_rev = reaction.getReversible()
-        if rxn_lb < -bound:
-            rxn_lb = -bound
-        if rxn_ub > bound:
-            rxn_ub = bound
-        if rxn_lb < 0:
-            rxn_rev = True
+        for i, s in get_rxn_column(model, reaction, species_index).items():
+            S[i, j] = s
+        rxn_lb, rxn_ub, rxn_c, rxn_rev = get_rxn_parameters(reaction, bound)
         lb.append(rxn_lb)
         ub.append(rxn_ub)
         c.append(rxn_c)
         rev.append(rxn_rev)
-    lb, ub, c, b = numpy.array(lb), numpy.array(ub), numpy.array(c), \
-        numpy.array(b)
-    rev = numpy.array(rev)
+    lb, ub, c, b = np.array(lb), np.array(ub), np.array(c), \
+        np.array(b)
+    rev = np.array(rev)
     cobra = {'S': S, 'lb': lb, 'ub': ub, 'c': c, 'b': b, 'rev': rev}
     return cobra
 
 
+def get_species_index(sbml):
+    '''Map species ID to row index in S.'''
+    model = sbml.getModel()
+    return dict((species.getId(), i)
+                for i, species in enumerate(model.getListOfSpecies()))
+
+
+def get_rxn_column(model, reaction, species_index):
+    '''
+    Return the column of S for reaction as a dictionary {row: coefficient},
+    ignoring boundary species.
+    '''
+    column = {}
+    for reactant in reaction.getListOfReactants():
+        sID = reactant.getSpecies()
+        if not model.getSpecies(sID).getBoundaryCondition():
+            i = species_index[sID]
+            column[i] = column.get(i, 0.) - reactant.getStoichiometry()
+    for product in reaction.getListOfProducts():
+        sID = product.getSpecies()
+        if not model.getSpecies(sID).getBoundaryCondition():
+            i = species_index[sID]
+            column[i] = column.get(i, 0.) + product.getStoichiometry()
+    return column
+
+
+def get_rxn_parameters(reaction, bound=INF):
+    '''
+    Return lb, ub, c and rev of reaction, with the bounds clipped to
+    +/- bound.
+    '''
+    kinetic_law = reaction.getKineticLaw()
+    rxn_lb = kinetic_law.getParameter('LOWER_BOUND').getValue()
+    rxn_ub = kinetic_law.getParameter('UPPER_BOUND').getValue()
+    rxn_c = kinetic_law.getParameter('OBJECTIVE_COEFFICIENT').getValue()
+    rxn_rev = reaction.getReversible()
+    if rxn_lb < -bound:
+        rxn_lb = -bound
+    if rxn_ub > bound:
+        rxn_ub = bound
+    if rxn_lb < 0:
+        rxn_rev = True
+    return rxn_lb, rxn_ub, rxn_c, rxn_rev
+
+
 def easy_lp(f, a, b, vlb, vub, one=False):
     '''
     Optimize lp using Gurobi.
     '''
-    # create gurobi model
-    lp = gurobipy.Model()
-    lp.Params.OutputFlag = 0
-    lp.Params.FeasibilityTol = 1e-9  # as per Cobra
-    lp.Params.OptimalityTol = 1e-9  # as per Cobra
-    rows, cols = a.shape
-    # add variables to model
-    for j in xrange(cols):
-        LB = vlb[j]
-        if LB == -INF:
-            LB = -gurobipy.GRB.INFINITY
-        UB = vub[j]
-        if UB == INF:
-            UB = gurobipy.GRB.INFINITY
-        lp.addVar(lb=LB, ub=UB, obj=f[j])
-    lp.update()
-    lpvars = lp.getVars()
-    # iterate over the rows of S adding each row into the model
-    S = a.tocsr()
-    for i in xrange(rows):
-        start = S.indptr[i]
-        end = S.indptr[i + 1]
-        variables = [lpvars[j] for j in S.indices[start:end]]
-        coeff = S.data[start:end]
-        expr = gurobipy.LinExpr(coeff, variables)
-        lp.addConstr(lhs=expr, sense=gurobipy.GRB.EQUAL, rhs=b[i])
-    lp.update()
-    lp.ModelSense = -1
-    lp.optimize()
-
-    v = numpy.empty(len(f))
-    v[:] = NAN
-    f_opt = NAN
-    conv = False
-    if lp.Status == gurobipy.GRB.OPTIMAL:
-        f_opt = lp.ObjVal
-        conv = True
-        v = [var.x for var in lp.getVars()]
+    lp = build_lp(f, a, b, vlb, vub)
+    v, f_opt, conv = solve_lp(lp)
 
     # remove model: better memory management?
     del lp
@@ -539,7 +691,7 @@ def easy_lp(f, a, b, vlb, vub, one=False):
         b.append(f_opt)
         f = [0.] * len(f)
         nS, nR = a.shape
-        for i in xrange(nR):
+        for i in range(nR):
             col = sparse.lil_matrix((nS + i, 1))
             a = sparse.hstack([a, col, col])
             row = sparse.lil_matrix((1, nR + 2 * i + 2))
@@ -557,12 +709,298 @@ def easy_lp(f, a, b, vlb, vub, one=False):
         v_sol = easy_lp(f, a, b, vlb, vub, one=False)[0]
         v = v_sol[:nR]
 
+    return v, f_opt, conv
+
+
+def build_lp(f, a, b, vlb, vub):
+    '''
+    Build the Gurobi model max f.v subject to a.v = b, vlb <= v <= vub.
+    '''
+    # create gurobi model
+    lp = gurobipy.Model()
+    lp.Params.OutputFlag = 0
+    lp.Params.FeasibilityTol = 1e-9  # as per Cobra
+    lp.Params.OptimalityTol = 1e-9  # as per Cobra
+    rows, cols = a.shape
+    # add variables to model
+    for j in range(cols):
+        lp.addVar(lb=grb_bound(vlb[j]), ub=grb_bound(vub[j]), obj=f[j])
+    lp.update()
+    lpvars = lp.getVars()
+    # iterate over the rows of S adding each row into the model
+    S = a.tocsr()
+    for i in range(rows):
+        start = S.indptr[i]
+        end = S.indptr[i + 1]
+        variables = [lpvars[j] for j in S.indices[start:end]]
+        coeff = S.data[start:end]
+        expr = gurobipy.LinExpr(coeff, variables)
+        lp.addLConstr(expr, gurobipy.GRB.EQUAL, b[i])
+    lp.update()
+    lp.ModelSense = -1
+    return lp
+
+
+def solve_lp(lp):
+    '''
+    Optimize a model from build_lp and return v, f_opt, conv.
+    '''
+    lp.optimize()
+
+    v = np.empty(lp.NumVars)
+    v[:] = NAN
+    f_opt = NAN
+    conv = False
+    if lp.Status == gurobipy.GRB.OPTIMAL:
+        f_opt = lp.ObjVal
+        conv = True
+        v = [var.x for var in lp.getVars()]
+
     if f_opt == -0.0:
         f_opt = 0.0
 
     return v, f_opt, conv
 
 
+def grb_bound(value):
+    '''Translate +/-INF to the Gurobi infinity.'''
+    if value == -INF:
+        return -gurobipy.GRB.INFINITY
+    if value == INF:
+        return gurobipy.GRB.INFINITY
+    return value
+
+
+class DocumentCache(object):
+    '''
+    Objects attached to SBML documents, such as their compiled models.
+
+    libsbml returns a new Python wrapper for the same document from calls
+    such as model.getSBMLDocument(), so entries are kept by address of the
+    underlying document rather than by wrapper. They are dropped when the
+    wrapper that owns the document, and frees it, is garbage collected; the
+    cached objects must not hold strong references to their document.
+    '''
+
+    def __init__(self):
+        # address of the document: [object, finalizer of the owner]
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, sbml):
+        '''Return the object attached to sbml, or None.'''
+        entry = self._entries.get(int(sbml.this))
+        if entry is None:
+            return None
+        if entry[1] is None and sbml.thisown:
+            self._watch(sbml, entry)
+        return entry[0]
+
+    def set(self, sbml, value):
+        '''Attach value to sbml, releasing the object it replaces.'''
+        self.pop(sbml)
+        entry = [value, None]
+        self._entries[int(sbml.this)] = entry
+        if sbml.thisown:
+            self._watch(sbml, entry)
+
+    def pop(self, sbml):
+        '''Release and return the object attached to sbml, or None.'''
+        entry = self._entries.pop(int(sbml.this), None)
+        if entry is None:
+            return None
+        if entry[1] is not None:
+            entry[1].detach()
+        return entry[0]
+
+    def _watch(self, sbml, entry):
+        # drop the entry when the owner frees the document, before its
+        # address can be reused
+        entry[1] = weakref.finalize(sbml, self._entries.pop, int(sbml.this),
+                                    None)
+        entry[1].atexit = False
+
+
+# compiled models of SBML documents; see get_compiled_model
+_compiled_models = DocumentCache()
+
+
+class CompiledModel(object):
+    '''
+    Cobra arrays and a loaded Gurobi model for an SBML document.
+
+    The model mutators (change_rxn_bounds, change_objective,
+    set_import_bounds, set_infinite_bounds, block_all_imports) record the
+    reactions they touch, and update() re-reads only those reactions and
+    patches the arrays and the Gurobi model in place. Adding or removing
+    species or reactions, or calling mark_structure_changed, triggers a
+    full rebuild.
+
+    Only a weak reference to the SBML document is kept, so that the
+    document and its compiled model can be garbage collected together.
+    '''
+
+    def __init__(self, sbml, bound=INF):
+        self.sbml = sbml
+        self.bound = bound
+        # counts the changes to S, for models derived from this one
+        self.revision = 0
+        self.rebuild()
+
+    @property
+    def sbml(self):
+        '''The SBML document, or None once it has been garbage collected.'''
+        return self._sbml()
+
+    @sbml.setter
+    def sbml(self, sbml):
+        self._sbml = weakref.ref(sbml)
+
+    def rebuild(self):
+        '''Convert the whole SBML document and reload the Gurobi model.'''
+        self.cobra = convert_sbml_to_cobra(self.sbml, self.bound)
+        cobra = self.cobra
+        self.sIDs, self.rIDs = get_structure_ids(self.sbml)
+        self.rxn_index = dict((rID, j) for j, rID in enumerate(self.rIDs))
+        self.species_index = dict((sID, i)
+                                  for i, sID in enumerate(self.sIDs))
+        self.lp = build_lp(list(cobra['c']), cobra['S'], list(cobra['b']),
+                           list(cobra['lb']), list(cobra['ub']))
+        self.lpvars = self.lp.getVars()
+        self.constrs = self.lp.getConstrs()
+        self.changed_parameters = set()
+        self.changed_stoichiometry = set()
+        self.structure_changed = False
+        self.revision += 1
+
+    def update(self):
+        '''Apply the changes recorded since the last update.'''
+        model = self.sbml.getModel()
+        # catches species or reactions added, removed or replaced directly
+        # through libsbml, even when their numbers stay the same
+        if self.structure_changed or \
+                get_structure_ids(self.sbml) != (self.sIDs, self.rIDs):
+            self.rebuild()
+            return
+        cobra = self.cobra
+        for j in self.changed_parameters:
+            reaction = model.getReaction(self.rIDs[j])
+            rxn_lb, rxn_ub, rxn_c, rxn_rev = get_rxn_parameters(reaction,
+                                                                self.bound)
+            cobra['lb'][j], cobra['ub'][j] = rxn_lb, rxn_ub
+            cobra['c'][j], cobra['rev'][j] = rxn_c, rxn_rev
+            var = self.lpvars[j]
+            var.LB, var.UB, var.Obj = grb_bound(rxn_lb), grb_bound(rxn_ub), \
+                rxn_c
+        S = cobra['S']
+        if self.changed_stoichiometry:
+            self.revision += 1
+        for j in self.changed_stoichiometry:
+            reaction = model.getReaction(self.rIDs[j])
+            column = get_rxn_column(model, reaction, self.species_index)
+            for i in S[:, j].nonzero()[0]:
+                if i not in column:
+                    S[i, j] = 0.
+                    self.lp.chgCoeff(self.constrs[i], self.lpvars[j], 0.)
+            for i, s in column.items():
+                S[i, j] = s
+                self.lp.chgCoeff(self.constrs[i], self.lpvars[j], s)
+        self.changed_parameters.clear()
+        self.changed_stoichiometry.clear()
+
+    def mark_parameters(self, rID):
+        '''Record a change to the bounds or objective of reaction rID.'''
+        if rID in self.rxn_index:
+            self.changed_parameters.add(self.rxn_index[rID])
+        else:
+            self.structure_changed = True
+
+    def mark_stoichiometry(self, rID):
+        '''Record a change to the reactants or products of reaction rID.'''
+        if rID in self.rxn_index:
+            self.changed_stoichiometry.add(self.rxn_index[rID])
+        else:
+            self.structure_changed = True
+
+
+def get_compiled_model(sbml, bound=INF):
+    '''
+    Return the CompiledModel of sbml, building it on first use and applying
+    the changes made through the model mutators since the last call.
+    '''
+    compiled = _compiled_models.get(sbml)
+    if compiled is None or compiled.bound != bound:
+        compiled = CompiledModel(sbml, bound)
+        _compiled_models.set(sbml, compiled)
+    else:
+        # the document may be reached through another libsbml wrapper
+        compiled.sbml = sbml
+        compiled.update()
+    return compiled
+
+
+def release_compiled_model(sbml):
+    '''
+    Drop the CompiledModel of sbml, if any, e.g. before discarding a model
+    that is still referenced elsewhere. Compiled models are otherwise
+    dropped when their document is garbage collected.
+    '''
+    _compiled_models.pop(sbml)
+
+
+def get_structure_ids(sbml):
+    '''Return the species and reaction IDs of sbml, in order, as lists.'''
+    model = sbml.getModel()
+    return ([model.getSpecies(i).getId()
+             for i in range(model.getNumSpecies())],
+            [model.getReaction(j).getId()
+             for j in range(model.getNumReactions())])
+
+
+def mark_stoichiometry_changed(sbml, rxn_name_list):
+    '''
+    Record that the reactants or products of reactions were edited directly
+    through libsbml, so the next get_compiled_model re-reads their columns.
+    '''
+    compiled = _compiled_models.get(sbml)
+    if compiled is None:
+        return
+    if isinstance(rxn_name_list, str):
+        rxn_name_list = [rxn_name_list]
+    for rID in rxn_name_list:
+        reaction = get_reaction_by_id(sbml, rID)
+        if not reaction:
+            print('reaction %s not found' % rID)
+        else:
+            compiled.mark_stoichiometry(reaction.getId())
+
+
+def mark_structure_changed(sbml):
+    '''
+    Record an edit that needs a full rebuild of the compiled model, e.g.
+    adding species or reactions or changing boundary conditions.
+    '''
+    compiled = _compiled_models.get(sbml)
+    if compiled is not None:
+        compiled.structure_changed = True
+
+
+def set_rxn_parameter(sbml, reaction, pID, value):
+    '''
+    Set the kinetic law parameter pID (LOWER_BOUND, UPPER_BOUND or
+    OBJECTIVE_COEFFICIENT) of reaction, recording the change for the
+    compiled model.
+    '''
+    param = reaction.getKineticLaw().getParameter(pID)
+    if param.getValue() != value:
+        param.setValue(value)
+        compiled = _compiled_models.get(sbml)
+        if compiled is not None:
+            compiled.mark_parameters(reaction.getId())
+
+
 def get_reaction_by_id(sbml, rID):
     '''Gets the reaction by id.'''
     model = sbml.getModel()
@@ -602,12 +1040,12 @@ def set_import_bounds(sbml, rxn_name_list, value):
     # convert single entries to lists
     if isinstance(rxn_name_list, str):
         rxn_name_list = [rxn_name_list]
-    if isinstance(value, (int, float, long, complex)):
+    if isinstance(value, (int, float, complex)):
         value = [value] * len(rxn_name_list)
     for index, rID in enumerate(rxn_name_list):
         reaction = get_reaction_by_id(sbml, rID)
         if not reaction:
-            print 'reaction %s not found' % rID
+            print('reaction %s not found' % rID)
         else:
             nR, nP = 0, 0
             for reactant in reaction.getListOfReactants():
@@ -618,14 +1056,13 @@ def set_import_bounds(sbml, rxn_name_list, value):
                 sID = product.getSpecies()
                 if not model.getSpecies(sID).getBoundaryCondition():
                     nP += 1
-            kineticLaw = reaction.getKineticLaw()
             val = abs(value[index])
             if (nR == 0) and (nP == 1):
-                kineticLaw.getParameter('UPPER_BOUND').setValue(val)
+                set_rxn_parameter(sbml, reaction, 'UPPER_BOUND', val)
             elif (nR == 1) and (nP == 0):
-                kineticLaw.getParameter('LOWER_BOUND').setValue(-val)
+                set_rxn_parameter(sbml, reaction, 'LOWER_BOUND', -val)
             else:
-                print 'reaction %s not import' % rID
+                print('reaction %s not import' % rID)
 
 
 def set_infinite_bounds(sbml):
@@ -635,12 +1072,10 @@ def set_infinite_bounds(sbml):
     model = sbml.getModel()
     for reaction in model.getListOfReactions():
         kineticLaw = reaction.getKineticLaw()
-        param = kineticLaw.getParameter('LOWER_BOUND')
-        if param.getValue() < -100:
-            param.setValue(-INF)
-        param = kineticLaw.getParameter('UPPER_BOUND')
-        if param.getValue() > 100:
-            param.setValue(INF)
+        if kineticLaw.getParameter('LOWER_BOUND').getValue() < -100:
+            set_rxn_parameter(sbml, reaction, 'LOWER_BOUND', -INF)
+        if kineticLaw.getParameter('UPPER_BOUND').getValue() > 100:
+            set_rxn_parameter(sbml, reaction, 'UPPER_BOUND', INF)
 
 
 def formula_to_map(formula):
@@ -679,7 +1114,7 @@ def map_to_formula(formula_map):
     'C6H12O6'
     '''
     formula = ''
-    for X in formula_map.keys():
+    for X in list(formula_map.keys()):
         if formula_map[X] == 0:
             del formula_map[X]
         elif formula_map[X] == int(formula_map[X]):
@@ -753,6 +1188,13 @@ def get_notes_field(eID, name, sbml):
     Gets the notes field.
     '''
     element = sbml.getModel().getElementBySId(eID)
+    return read_notes_field(element, name)
+
+
+def read_notes_field(element, name):
+    '''
+    Gets the notes field of an SBML element.
+    '''
     notes = element.getNotesString()
     f = re.search(name + ':([^<]+)', notes)
     return f.group(1).strip() if f is not None else ''
@@ -829,5 +1271,20 @@ def display_reaction_and_formula(rID, sbml):
     return txt + '\n' + txt_formula
 
 
+def run_all(model_path=None):
+    '''
+    Run the summary, balancing and max flux checks on every model returned
+    by list_models
+    '''
+    model_names, model_path = list_models(model_path)
+    reader = libsbml.SBMLReader()
+    for name in model_names:
+        print('\n%s' % name)
+        sbml = reader.readSBMLFromFile(os.path.join(model_path, name + '.xml'))
+        modelSummary(sbml)
+        model_balancing(sbml)
+        max_fluxes(sbml)
+
+
 if __name__ == '__main__':
     run_all()
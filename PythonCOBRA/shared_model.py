@@ -0,0 +1,199 @@
+"""
+Shared-memory copies of compiled models for multi-process workers.
+
+The parent places the CSR arrays of S, the bounds, objective and ID tables
+in multiprocessing.shared_memory segments and passes the small, picklable
+handle to its workers, which attach to the segments without copying and
+build their Gurobi models from the views:
+
+    shared = share_model(sbml)
+    pool = multiprocessing.Pool(64, init_worker, (shared.handle,))
+    ...  # tasks call worker_model() to get the worker's SharedModel
+    pool.close()
+    pool.join()
+    shared.unlink()
+"""
+
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from scipy import sparse
+
+from metabolicModeling import INF, build_lp, get_compiled_model, \
+    get_species_index
+
+# arrays of the cobra dictionary placed in shared memory, besides S
+ARRAYS = ['lb', 'ub', 'c', 'b', 'rev']
+# arrays copied into each process by build, since scenarios change them
+PRIVATE = ['lb', 'ub', 'c']
+
+
+class SharedModel(object):
+    '''
+    A compiled model whose arrays live in shared memory. cobra holds the
+    same fields as CompiledModel.cobra, with S as a CSR matrix, all views
+    on the segments, read-only outside the creating process; lp and lpvars
+    are built by build().
+
+    Only the process that created the segments should unlink them. The
+    views must not be used after close().
+    '''
+
+    def __init__(self, handle, create=False):
+        self.handle = handle
+        self.segments = []
+        self.owner = create
+        views = dict((key, self._attach(name, shape, dtype))
+                     for key, (name, shape, dtype)
+                     in handle['arrays'].items())
+        self.cobra = dict((key, views[key]) for key in ARRAYS)
+        self.cobra['S'] = sparse.csr_matrix(
+            (views['data'], views['indices'], views['indptr']),
+            shape=tuple(handle['shape']), copy=False)
+        self._rIDs = views['rIDs']
+        self._sIDs = views['sIDs']
+        self.lp = None
+        self.lpvars = None
+
+    def _attach(self, name, shape, dtype):
+        if name is None:
+            # zero-length arrays need no segment
+            return np.empty(shape, dtype=dtype)
+        # the creating process is responsible for unlinking
+        segment = open_segment(name, track=self.owner)
+        self.segments.append(segment)
+        view = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+        view.flags.writeable = self.owner
+        return view
+
+    @property
+    def rIDs(self):
+        return [rID.decode() for rID in self._rIDs]
+
+    @property
+    def sIDs(self):
+        return [sID.decode() for sID in self._sIDs]
+
+    @property
+    def rxn_index(self):
+        return dict((rID, j) for j, rID in enumerate(self.rIDs))
+
+    def build(self):
+        '''
+        Build the Gurobi model of this process from the shared arrays, with
+        private copies of the bounds and objective.
+        '''
+        if self.lp is None:
+            cobra = self.cobra
+            for key in PRIVATE:
+                cobra[key] = cobra[key].copy()
+            self.lp = build_lp(cobra['c'], cobra['S'], cobra['b'],
+                               cobra['lb'], cobra['ub'])
+            self.lpvars = self.lp.getVars()
+        return self
+
+    def close(self):
+        '''Release the views and detach from the segments.'''
+        self.lp, self.lpvars = None, None
+        self.cobra, self._rIDs, self._sIDs = None, None, None
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+    def unlink(self):
+        '''Close and free the segments; only for the creating process.'''
+        names = [name for name, _, _ in self.handle['arrays'].values()
+                 if name is not None]
+        self.close()
+        for name in names:
+            segment = shared_memory.SharedMemory(name=name)
+            segment.close()
+            segment.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
+
+
+def open_segment(name, track=True):
+    '''
+    Open an existing shared memory segment; untracked segments are not
+    unlinked by the resource tracker when this process exits.
+    '''
+    try:
+        return shared_memory.SharedMemory(name=name, track=track)
+    except TypeError:
+        # Python < 3.13 has no track argument and always registers
+        if track:
+            return shared_memory.SharedMemory(name=name)
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+def share_model(sbml, bound=INF):
+    '''
+    Copy the compiled model of sbml to shared memory and return the owning
+    SharedModel; pass its handle to the workers.
+    '''
+    compiled = get_compiled_model(sbml, bound)
+    cobra = compiled.cobra
+    S = cobra['S'].tocsr()
+    species_index = get_species_index(sbml)
+    sIDs = sorted(species_index, key=species_index.get)
+    arrays = {'data': S.data, 'indices': S.indices, 'indptr': S.indptr,
+              'rIDs': np.array([rID.encode() for rID in compiled.rIDs]),
+              'sIDs': np.array([sID.encode() for sID in sIDs])}
+    for key in ARRAYS:
+        arrays[key] = np.asarray(cobra[key])
+    handle = {'shape': S.shape, 'arrays': {}}
+    created = []
+    try:
+        for key, array in arrays.items():
+            name = None
+            if array.nbytes:
+                segment = shared_memory.SharedMemory(create=True,
+                                                     size=array.nbytes)
+                created.append(segment)
+                view = np.ndarray(array.shape, dtype=array.dtype,
+                                  buffer=segment.buf)
+                view[...] = array
+                del view
+                name = segment.name
+                segment.close()
+            handle['arrays'][key] = (name, array.shape, array.dtype.str)
+        return SharedModel(handle, create=True)
+    except BaseException:
+        # no one else knows the names, so free the segments made so far
+        for segment in created:
+            segment.close()
+            segment.unlink()
+        raise
+
+
+def attach_model(handle):
+    '''Attach to a model shared by share_model, without copying it.'''
+    return SharedModel(handle)
+
+
+# SharedModel of a pool worker, see init_worker
+_worker_model = None
+
+
+def init_worker(handle):
+    '''Pool initializer: attach to the shared model and build its LP.'''
+    global _worker_model
+    _worker_model = attach_model(handle).build()
+
+
+def worker_model():
+    '''Return the SharedModel attached by init_worker.'''
+    return _worker_model
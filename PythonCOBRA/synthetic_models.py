@@ -0,0 +1,417 @@
+"""
+Seeded generator for synthetic COBRA-style SBML models, used to benchmark the
+functions in metabolicModeling without shipping genome-scale models.
+"""
+
+import argparse
+import os
+import re
+
+import libsbml
+import numpy as np
+
+from metabolicModeling import format_for_SBML_ID
+
+# label: number of reactions, roughly matching published reconstructions
+MODEL_SIZES = [
+    ('ecoli_core', 95),
+    ('iJO1366', 2583),
+    ('recon1', 3742),
+    ('recon2', 7440),
+    ('synthetic_20k', 20000),
+]
+
+# metabolites referenced by max_fluxes, present in every synthetic model
+NAMED_METABOLITES = [
+    'glc', 'fru', 'arg_L', 'asn_L', 'gln_L', 'glu_L', 'his_L', 'ser_L',
+    'trp_L', 'ca2', 'cl', 'fe2', 'fe3', 'h', 'h2o', 'k', 'na1', 'nh4',
+    'so4', 'pi', 'o2', 'atp', 'adp', 'nad', 'nadh', 'co2',
+]
+NAMED_REACTIONS = ['HXPRT', 'OMPDC', 'PSP_L', 'AIRCr_PRASCS']
+# carbon sources of max_fluxes; the others are converted to glucose
+CARBON_SOURCES = ['glc', 'fru', 'arg_L', 'asn_L', 'gln_L', 'glu_L', 'his_L',
+                  'ser_L', 'trp_L']
+NAMED_FORMULAE = {
+    'glc': 'C6H12O6', 'fru': 'C6H12O6', 'arg_L': 'C6H15N4O2',
+    'asn_L': 'C4H8N2O3', 'gln_L': 'C5H10N2O3', 'glu_L': 'C5H8NO4',
+    'his_L': 'C6H9N3O2', 'ser_L': 'C3H7NO3', 'trp_L': 'C11H12N2O2',
+    'ca2': 'Ca', 'cl': 'Cl', 'fe2': 'Fe', 'fe3': 'Fe', 'h': 'H',
+    'h2o': 'H2O', 'k': 'K', 'na1': 'Na', 'nh4': 'H4N', 'so4': 'O4S',
+    'pi': 'HO4P', 'o2': 'O2', 'atp': 'C10H12N5O13P3',
+    'adp': 'C10H12N5O10P2', 'nad': 'C21H26N7O14P2',
+    'nadh': 'C21H27N7O14P2', 'co2': 'CO2',
+}
+# carbon atoms of the generated metabolites, which internal reactions
+# conserve
+MAX_CARBON = 12
+# attempts at drawing a balanced random reaction before giving up
+MAX_TRIES = 1000
+
+SPECIES_PER_REACTION = 0.7
+EXTRACELLULAR_FRACTION = 0.15
+GENES_PER_REACTION = 0.6
+BOUND = 1000.
+
+SBO_SIMPLE_CHEMICAL = 247
+SBO_BIOCHEMICAL_REACTION = 176
+SBO_TRANSPORT_REACTION = 185
+SBO_EXCHANGE_REACTION = 627
+SBO_DEMAND_REACTION = 628
+SBO_BIOMASS_REACTION = 629
+
+
+def synthetic_model(n_reactions, seed=0, name=None):
+    '''
+    Build a synthetic SBML level 2 document in the COBRA format with about
+    n_reactions reactions. Bounds and objective live in kinetic law
+    parameters, FORMULA and GENE_ASSOCIATION in the notes. The same seed
+    always gives the same model.
+
+    Internal reactions conserve carbon, which only the imports supply, and
+    every metabolite can be made from glucose, so that objectives have
+    finite, nonzero optima as in a real reconstruction.
+    '''
+    rng = np.random.default_rng(seed)
+    if name is None:
+        name = 'synthetic_%d' % n_reactions
+
+    sbml = libsbml.SBMLDocument(2, 4)
+    model = sbml.createModel()
+    model.setId(name)
+    for cID, cName in [('c', 'cytosol'), ('e', 'extracellular'),
+                       ('b', 'boundary')]:
+        compartment = model.createCompartment()
+        compartment.setId(cID)
+        compartment.setName(cName)
+
+    n_species = max(int(SPECIES_PER_REACTION * n_reactions),
+                    len(NAMED_METABOLITES) + 10)
+    n_extra = max(int(EXTRACELLULAR_FRACTION * n_species),
+                  len(NAMED_METABOLITES))
+    n_cyto = max(n_species - n_extra, len(NAMED_METABOLITES))
+    names = NAMED_METABOLITES + ['m%d' % i for i in
+                                 range(n_cyto - len(NAMED_METABOLITES))]
+    # cycle through the carbon numbers first so that every one is used
+    carbon = [_carbon(NAMED_FORMULAE[met]) for met in NAMED_METABOLITES] + \
+        [1 + i % MAX_CARBON if i < 2 * MAX_CARBON else
+         int(rng.integers(1, MAX_CARBON + 1))
+         for i in range(n_cyto - len(NAMED_METABOLITES))]
+    carbon = np.array(carbon)
+    glc = names.index('glc')
+    sources = [names.index(met) for met in CARBON_SOURCES if met != 'glc']
+    # precursors made only by the named reactions and used only for biomass
+    # and a demand reaction, which keeps the named reactions off every
+    # internal loop; each has the carbon number of a metabolite it can be
+    # made from
+    precursors = np.arange(n_cyto - len(NAMED_REACTIONS), n_cyto)
+    made = np.setdiff1d(np.flatnonzero(carbon > 0),
+                        np.concatenate([sources, precursors]))
+    carbon[precursors] = rng.choice(carbon[made], size=len(precursors))
+    formulae = [NAMED_FORMULAE[met] if met in NAMED_FORMULAE else
+                _random_formula(rng, carbon[index])
+                for index, met in enumerate(names)]
+
+    for index, met in enumerate(names):
+        _add_species(model, rng, met, 'c', formulae[index])
+    for index, met in enumerate(names[:n_extra]):
+        _add_species(model, rng, met, 'e', formulae[index])
+        _add_species(model, rng, met, 'b', formulae[index], boundary=True)
+
+    genes = ['G%05d' % i for i in
+             range(max(int(GENES_PER_REACTION * n_reactions), 1))]
+
+    # exchange and transport reactions for every extracellular metabolite
+    for met in names[:n_extra]:
+        _add_reaction(model, format_for_SBML_ID('EX_%s(e)' % met),
+                      {'M_%s_e' % met: 1.}, {'M_%s_b' % met: 1.},
+                      -BOUND if rng.random() < 0.3 else 0., BOUND,
+                      SBO_EXCHANGE_REACTION)
+        _add_reaction(model, format_for_SBML_ID('%st' % met),
+                      {'M_%s_e' % met: 1.}, {'M_%s_c' % met: 1.},
+                      -BOUND, BOUND, SBO_TRANSPORT_REACTION,
+                      _random_gpr(rng, genes))
+    _add_reaction(model, format_for_SBML_ID('DM_atp_c_'),
+                  {'M_atp_c': 1.}, {}, 0., BOUND, SBO_DEMAND_REACTION)
+
+    # hub metabolites (h, h2o, atp, ...) take part in many more reactions
+    weights = 1. / np.arange(1, n_cyto + 1) ** 0.9
+    weights /= weights.sum()
+    n_internal = max(n_reactions - model.getNumReactions() - 1,
+                     len(NAMED_REACTIONS))
+    # the metabolites made inside the cell, by carbon number
+    made = made[np.argsort(carbon[made], kind='stable')]
+    by_carbon = dict((n, made[carbon[made] == n])
+                     for n in np.unique(carbon[made]))
+    inorganic = np.flatnonzero(carbon == 0)
+
+    # a tree of irreversible reactions making every metabolite from
+    # glucose, smallest first, so that they are all reachable on any
+    # carbon source
+    tree = []
+    usable = np.zeros(n_cyto, dtype=bool)
+    usable[glc] = True
+    latest = {carbon[glc]: glc}
+    for target in made:
+        if not usable[target]:
+            column = _producing_column(rng, target, carbon, usable,
+                                       by_carbon, weights, latest)
+            for i, s in column.items():
+                if s > 0 and not usable[i]:
+                    usable[i] = True
+                    latest[carbon[i]] = i
+            tree.append(column)
+    # the other carbon sources feed into glucose, e.g. 3 asn_L -> 2 glc
+    for i in sources:
+        lcm = int(np.lcm(carbon[i], carbon[glc]))
+        tree.append({i: -float(lcm // carbon[i]),
+                     glc: float(lcm // carbon[glc])})
+    named = [{_pick(rng, by_carbon[carbon[i]], weights): -1., i: 1.}
+             for i in precursors]
+    columns = named + tree
+    n_irreversible = len(columns)
+    # substrates of the other reactions: hubs, but every metabolite often
+    # enough that few are dead ends
+    p = weights[made] / weights[made].sum() + 1. / len(made)
+    p /= p.sum()
+    # the first of them consume what the tree leaves unused
+    dead_ends = _dead_ends(columns, made)
+    while len(columns) < n_internal:
+        substrate = dead_ends.pop() if dead_ends else None
+        columns.append(_balanced_column(rng, carbon, made, by_carbon, p,
+                                        substrate))
+
+    # demand reactions drain the precursors and the byproducts that nothing
+    # else consumes, in place of the last random reactions
+    dead_ends = _dead_ends(columns, made)
+    columns = columns[:max(len(columns) - len(dead_ends) - len(precursors),
+                           n_irreversible)]
+    for i in list(precursors) + _dead_ends(columns, made):
+        _add_reaction(model, format_for_SBML_ID('DM_%s_c_' % names[i]),
+                      {'M_%s_c' % names[i]: 1.}, {}, 0., BOUND,
+                      SBO_DEMAND_REACTION)
+
+    o2 = names.index('o2')
+    # biomass from any metabolite made from glucose without oxygen
+    candidates = np.setdiff1d(np.arange(n_cyto),
+                              np.concatenate([sources, precursors, [o2]]))
+    biomass = np.concatenate([rng.choice(
+        candidates, size=min(30 - len(precursors), len(candidates)),
+        replace=False, p=weights[candidates] / weights[candidates].sum()),
+        precursors])
+    _add_reaction(model, 'R_biomass',
+                  dict(('M_%s_c' % names[i], round(rng.uniform(0.01, 2.), 3))
+                       for i in biomass), {},
+                  0., BOUND, SBO_BIOMASS_REACTION, objective=1.)
+
+    for j, column in enumerate(columns):
+        rID = format_for_SBML_ID(NAMED_REACTIONS[j]) \
+            if j < len(NAMED_REACTIONS) else 'R_r%d' % j
+        # protons, water, phosphate, ... as cofactors; only reactions off
+        # the tree may need oxygen
+        for i in rng.choice(inorganic, size=rng.integers(0, 3),
+                            replace=False):
+            if i not in column and (i != o2 or j >= n_irreversible):
+                column[i] = rng.choice([-1., 1.])
+        reactants = dict(('M_%s_c' % names[i], -s)
+                         for i, s in column.items() if s < 0)
+        products = dict(('M_%s_c' % names[i], s)
+                        for i, s in column.items() if s > 0)
+        # about a third of the reactions off the tree are reversible
+        reversible = j >= n_irreversible and rng.random() < 0.35
+        _add_reaction(model, rID, reactants, products,
+                      -BOUND if reversible else 0., BOUND,
+                      SBO_BIOCHEMICAL_REACTION, _random_gpr(rng, genes))
+
+    return sbml
+
+
+def write_synthetic_models(model_path, sizes=None, seed=0):
+    '''
+    Write one synthetic model per (label, n_reactions) in sizes to
+    model_path/<label>.xml, in the layout expected by list_models.
+    '''
+    if sizes is None:
+        sizes = MODEL_SIZES
+    if not os.path.isdir(model_path):
+        os.makedirs(model_path)
+    filenames = []
+    for label, n_reactions in sizes:
+        sbml = synthetic_model(n_reactions, seed=seed, name=label)
+        filename = os.path.join(model_path, label + '.xml')
+        libsbml.writeSBMLToFile(sbml, filename)
+        filenames.append(filename)
+    return filenames
+
+
+def _add_species(model, rng, met, compartment, formula, boundary=False):
+    species = model.createSpecies()
+    species.setId('M_%s_%s' % (met, compartment))
+    species.setName(met)
+    species.setCompartment(compartment)
+    species.setBoundaryCondition(boundary)
+    # leave a few species without an SBO term, as in real reconstructions
+    if rng.random() > 0.05:
+        species.setSBOTerm(SBO_SIMPLE_CHEMICAL)
+    species.setNotes(_notes({'FORMULA': formula}))
+
+
+def _add_reaction(model, rID, reactants, products, lb, ub, sbo, gpr='',
+                  objective=0.):
+    reaction = model.createReaction()
+    reaction.setId(rID)
+    reaction.setReversible(lb < 0)
+    reaction.setSBOTerm(sbo)
+    for sID, s in reactants.items():
+        reference = reaction.createReactant()
+        reference.setSpecies(sID)
+        reference.setStoichiometry(s)
+    for sID, s in products.items():
+        reference = reaction.createProduct()
+        reference.setSpecies(sID)
+        reference.setStoichiometry(s)
+    kinetic_law = reaction.createKineticLaw()
+    kinetic_law.setMath(libsbml.parseFormula('FLUX_VALUE'))
+    for pID, value in [('LOWER_BOUND', lb),
+                       ('UPPER_BOUND', ub),
+                       ('OBJECTIVE_COEFFICIENT', objective),
+                       ('FLUX_VALUE', 0.)]:
+        parameter = kinetic_law.createParameter()
+        parameter.setId(pID)
+        parameter.setValue(value)
+    reaction.setNotes(_notes({'GENE_ASSOCIATION': gpr}))
+
+
+def _notes(fields):
+    body = ''.join('<p>%s: %s</p>' % (key, value)
+                   for key, value in sorted(fields.items()))
+    return '<body xmlns="http://www.w3.org/1999/xhtml">%s</body>' % body
+
+
+def _carbon(formula):
+    '''Number of carbon atoms in a formula such as C6H12O6.'''
+    match = re.search(r'C(\d*)(?![a-z])', formula)
+    if match is None:
+        return 0
+    return int(match.group(1) or 1)
+
+
+def _random_formula(rng, carbon):
+    '''
+    Random CHNOPS formula with the given number of carbon atoms; a few are
+    left unknown or polymeric.
+    '''
+    u = rng.random()
+    if u < 0.03:
+        return ''
+    if u < 0.05:
+        return 'C%dH10O5R' % carbon
+    counts = [('C', carbon), ('H', rng.integers(0, 2 * carbon + 3)),
+              ('N', rng.integers(0, 8)), ('O', rng.integers(0, 20)),
+              ('P', rng.integers(0, 4)), ('S', rng.integers(0, 2))]
+    return ''.join('%s%s' % (X, n if n != 1 else '')
+                   for X, n in counts if n > 0)
+
+
+def _producing_column(rng, target, carbon, usable, by_carbon, weights,
+                      latest):
+    '''
+    Column {metabolite: coefficient} of a reaction making target from
+    usable metabolites with as many carbon atoms on either side: an
+    isomerisation of the latest metabolite made with that carbon number
+    (latest), which grows chains rather than stars, or else a cleavage or a
+    condensation.
+    '''
+    n = carbon[target]
+    if n in latest:
+        return {latest[n]: -1., target: 1.}
+    # cleave a larger metabolite into target and the rest
+    pool = np.flatnonzero(usable & (carbon > 0))
+    for i in sorted(pool[carbon[pool] > n], key=carbon.__getitem__):
+        rest = [k for k in by_carbon.get(carbon[i] - n, [])
+                if k not in (i, target)]
+        if rest:
+            return {i: -1., target: 1., _pick(rng, rest, weights): 1.}
+    # or condense smaller ones, largest first
+    column = {}
+    remaining = n
+    while remaining:
+        smaller = pool[carbon[pool] <= remaining]
+        largest = smaller[carbon[smaller] == carbon[smaller].max()]
+        i = _pick(rng, largest, weights)
+        column[i] = column.get(i, 0.) - 1.
+        remaining -= carbon[i]
+    column[target] = 1.
+    return column
+
+
+def _dead_ends(columns, metabolites):
+    '''The metabolites that no column consumes.'''
+    consumed = set(i for column in columns for i, s in column.items()
+                   if s < 0)
+    return [i for i in metabolites if i not in consumed]
+
+
+def _pick(rng, indices, weights):
+    '''Pick one of indices, favouring hub metabolites.'''
+    indices = np.asarray(indices)
+    p = weights[indices] / weights[indices].sum()
+    return indices[rng.choice(len(indices), p=p)]
+
+
+def _balanced_column(rng, carbon, organic, by_carbon, p, substrate=None):
+    '''
+    Random column {metabolite: coefficient} of one or two organic
+    substrates (including substrate, if given) and products with as many
+    carbon atoms on either side, e.g. a condensation, cleavage or
+    isomerisation. organic is sorted by carbon number.
+    '''
+    for _ in range(MAX_TRIES):
+        nR = rng.integers(1, 3)
+        reactants = rng.choice(organic, size=nR, replace=False, p=p)
+        if substrate is not None:
+            reactants = np.unique([substrate] + list(reactants[1:]))
+            nR = len(reactants)
+        stoich = np.where(rng.random(nR) < 0.1, 2., 1.)
+        remaining = int(np.dot(carbon[reactants], stoich))
+        column = dict((i, -s) for i, s in zip(reactants, stoich))
+        if rng.random() < 0.5:
+            # cleave off a smaller product first
+            n_smaller = np.searchsorted(carbon[organic], remaining)
+            if n_smaller:
+                i = organic[rng.integers(n_smaller)]
+                if i not in column:
+                    column[i] = 1.
+                    remaining -= carbon[i]
+        s = 2. if remaining % 2 == 0 and rng.random() < 0.1 else 1.
+        candidates = by_carbon.get(remaining // int(s), [])
+        if len(candidates):
+            i = candidates[rng.integers(len(candidates))]
+            if i not in column:
+                column[i] = s
+                return column
+    raise ValueError('no carbon-balanced reaction found in %d tries'
+                     % MAX_TRIES)
+
+
+def _random_gpr(rng, genes):
+    '''Random gene association such as "( G1 and G2 ) or G3".'''
+    if rng.random() < 0.25:
+        return ''
+    clauses = []
+    for _ in range(rng.integers(1, 4)):
+        subunits = rng.choice(len(genes), size=min(rng.integers(1, 3),
+                                                   len(genes)),
+                              replace=False)
+        clause = ' and '.join(genes[i] for i in subunits)
+        clauses.append('( %s )' % clause if len(subunits) > 1 else clause)
+    return ' or '.join(clauses)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--output', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for filename in write_synthetic_models(args.output, seed=args.seed):
+        print(filename)
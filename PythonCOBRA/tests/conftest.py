@@ -0,0 +1,11 @@
+import os
+import sys
+
+# the PythonCOBRA modules are imported as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# medium and objectives of the media, shared-model, max_flux and service
+# tests, on the exchange and named reactions of the synthetic models
+MEDIUM = {'EX_glc(e)': 1., 'EX_o2(e)': float('inf'), 'EX_nh4(e)': 10.,
+          'EX_pi(e)': 10., 'EX_h2o(e)': float('inf')}
+OBJECTIVES = ['DM_atp_c_', 'HXPRT', 'OMPDC', 'PSP_L', 'AIRCr_PRASCS']
@@ -0,0 +1,189 @@
+"""
+Model cache of the service workers, message encoding and clients that go
+away in the middle of a job.
+"""
+
+import asyncio
+import json
+import os
+import threading
+
+import libsbml
+import numpy as np
+import pytest
+
+import analysis_service
+import metabolicModeling as mm
+from conftest import MEDIUM, OBJECTIVES
+from media import solve_media
+from synthetic_models import synthetic_model
+
+
+@pytest.fixture
+def model_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(analysis_service, '_models', {})
+    path = str(tmp_path / 'model.xml')
+    libsbml.writeSBMLToFile(synthetic_model(95, seed=0), path)
+    return path
+
+
+class CountingExecutor(object):
+    '''An executor that counts the calls submitted to it.'''
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.calls = []
+
+    def __getattr__(self, name):
+        return getattr(self.executor, name)
+
+    def submit(self, func, *args):
+        self.calls.append((func, args))
+        return self.executor.submit(func, *args)
+
+
+@pytest.fixture
+def service(tmp_path):
+    '''A service on a Unix socket, run by an event loop in a thread.'''
+    path = str(tmp_path / 'service.sock')
+    service = analysis_service.AnalysisService(2)
+    service.executor = CountingExecutor(service.executor)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    server = asyncio.run_coroutine_threadsafe(
+        asyncio.start_unix_server(service.handle_client, path), loop).result()
+    try:
+        yield service, path
+    finally:
+        async def stop():
+            server.close()
+            await server.wait_closed()
+            # let the client handlers close their connections
+            await asyncio.gather(*(asyncio.all_tasks() -
+                                   {asyncio.current_task()}))
+        asyncio.run_coroutine_threadsafe(stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        service.shutdown()
+
+
+def results_by_job(messages):
+    results = {}
+    for message in messages:
+        assert message['event'] != 'error', message
+        if message['event'] == 'result':
+            results.setdefault(message['id'], {})[message['index']] = \
+                message['result']
+    return results
+
+
+def test_jobs(model_file, service, capsys):
+    service, path = service
+    media = [dict(MEDIUM, **{'EX_glc(e)': k + 1.}) for k in range(4)]
+    requests = [{'id': 1, 'job': 'fba', 'model': model_file,
+                 'objectives': OBJECTIVES, 'medium': MEDIUM},
+                {'id': 2, 'job': 'sweep', 'model': model_file,
+                 'objectives': OBJECTIVES, 'media': media},
+                {'id': 3, 'job': 'summary', 'model': model_file}]
+    messages = list(analysis_service.request_jobs(requests, path=path))
+    assert sorted(m['id'] for m in messages if m['event'] == 'done') == \
+        [1, 2, 3]
+    results = results_by_job(messages)
+    sbml = libsbml.SBMLReader().readSBMLFromFile(model_file)
+    expected = solve_media(sbml, [MEDIUM] + media, OBJECTIVES)
+    np.testing.assert_allclose(results[1][0], expected[0], rtol=1e-9)
+    np.testing.assert_allclose([results[2][i] for i in range(len(media))],
+                               expected[1:], rtol=1e-9)
+    assert results[3][0] == json.loads(json.dumps(
+        mm.model_statistics(sbml)))
+
+
+def test_identical_jobs_solved_once(model_file, service, capsys):
+    service, path = service
+    request = {'job': 'fba', 'model': model_file, 'objectives': OBJECTIVES,
+               'medium': MEDIUM}
+    # warm up the workers, so that both jobs are in flight together
+    list(analysis_service.request_jobs([dict(request, id=0, medium=None)],
+                                       path=path))
+    del service.executor.calls[:]
+    messages = list(analysis_service.request_jobs(
+        [dict(request, id=1), dict(request, id=2)], path=path))
+    results = results_by_job(messages)
+    assert results[1] == results[2]
+    assert len(service.executor.calls) == 1
+    assert service.executor.calls[0][0] is analysis_service.run_task
+
+
+def test_invalid_requests(model_file, service, capsys):
+    service, path = service
+    requests = [[1, 2], 'summary',
+                {'id': 1, 'job': 'summary', 'model': model_file}]
+    messages = list(analysis_service.request_jobs(requests, path=path))
+    errors = [m for m in messages if m['event'] == 'error']
+    assert len(errors) == 2
+    assert all(m['id'] is None and 'not a JSON object' in m['message']
+               for m in errors)
+    assert [m['id'] for m in messages if m['event'] == 'done'] == [1]
+
+
+def test_load_model_cache(model_file, capsys):
+    finite = analysis_service.load_model(model_file)
+    infinite = analysis_service.load_model(model_file, True)
+    # both versions stay loaded while the file is unchanged
+    assert analysis_service.load_model(model_file) is finite
+    assert analysis_service.load_model(model_file, True) is infinite
+    assert mm._compiled_models.get(finite) is not None
+    os.utime(model_file, (0, os.path.getmtime(model_file) + 10))
+    reloaded = analysis_service.load_model(model_file)
+    assert reloaded is not finite
+    assert len(analysis_service._models) == 1
+    assert mm._compiled_models.get(finite) is None
+    assert mm._compiled_models.get(infinite) is None
+
+
+def test_encode_message():
+    message = {'event': 'result', 'result': [1.5, float('inf'),
+                                             -float('inf'), float('nan')]}
+    decoded = json.loads(analysis_service.encode_message(message))
+    assert decoded['result'] == [1.5, 'inf', '-inf', 'nan']
+    assert [float(x) for x in decoded['result']][:3] == \
+        [1.5, float('inf'), -float('inf')]
+
+
+def test_client_disconnect(model_file, tmp_path, capsys):
+    path = str(tmp_path / 'service.sock')
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        errors = []
+        loop.set_exception_handler(lambda loop, context:
+                                   errors.append(context))
+        service = analysis_service.AnalysisService(1)
+        finished = asyncio.Event()
+
+        async def handle(reader, writer):
+            try:
+                await service.handle_client(reader, writer)
+            finally:
+                finished.set()
+        server = await asyncio.start_unix_server(handle, path)
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+            media = [dict(MEDIUM, **{'EX_glc(e)': k + 1.})
+                     for k in range(200)]
+            request = {'id': 1, 'job': 'sweep', 'model': model_file,
+                       'objectives': ['DM_atp_c_'], 'media': media}
+            writer.write((json.dumps(request) + '\n').encode())
+            await writer.drain()
+            await reader.readline()
+            writer.transport.abort()
+            await asyncio.wait_for(finished.wait(), 60)
+        finally:
+            server.close()
+            await server.wait_closed()
+            service.shutdown()
+        return errors
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,62 @@
+"""
+Round trips of model tables and flux solutions through Parquet and Arrow.
+"""
+
+import libsbml
+import numpy as np
+import pytest
+
+import columnar
+import metabolicModeling as mm
+from synthetic_models import synthetic_model
+
+
+@pytest.fixture
+def cobra(tmp_path):
+    path = str(tmp_path / 'model.xml')
+    libsbml.writeSBMLToFile(synthetic_model(95, seed=0), path)
+    return mm.readSBML(path)
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.arrow'])
+def test_model_round_trip(cobra, tmp_path, extension):
+    directory = str(tmp_path / 'tables')
+    columnar.export_model(cobra, directory, extension)
+    imported = columnar.import_model(directory, extension)
+    assert (imported['S'] != cobra['S']).nnz == 0
+    assert imported['S'].shape == cobra['S'].shape
+    for key in ['rxns', 'mets', 'lb', 'ub', 'c', 'b', 'rev', 'metBoundary']:
+        np.testing.assert_array_equal(imported[key], np.asarray(cobra[key]))
+    np.testing.assert_array_equal(imported['metCharge'],
+                                  np.asarray(cobra['metCharge'], dtype=float))
+    assert imported['grRules'] == list(cobra['grRules'])
+    assert imported['metFormulas'] == list(cobra['metFormulas'])
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.arrow'])
+def test_charge_round_trip(cobra, tmp_path, extension):
+    charge = np.asarray(cobra['metCharge'], dtype=float)
+    charge[:3] = [0.5, -1.25, np.nan]
+    cobra['metCharge'] = charge
+    table = columnar.metabolite_table(cobra)
+    assert table['charge'].null_count == np.isnan(charge).sum()
+    directory = str(tmp_path / 'tables')
+    columnar.export_model(cobra, directory, extension)
+    imported = columnar.import_model(directory, extension)
+    np.testing.assert_array_equal(imported['metCharge'], charge)
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.arrow'])
+def test_flux_round_trip(tmp_path, extension):
+    rng = np.random.default_rng(0)
+    fluxes = rng.normal(size=(4, 7))
+    fluxes[1, 2] = np.inf
+    fluxes[3, 0] = np.nan
+    rxns = ['R%d' % j for j in range(7)]
+    conditions = ['glc', 'fru', 'gln_L', 'trp_L']
+    filename = str(tmp_path / ('fluxes' + extension))
+    columnar.write_fluxes(filename, fluxes, rxns, conditions)
+    read_conditions, read_rxns, read = columnar.read_fluxes(filename)
+    assert read_conditions == conditions
+    assert read_rxns == rxns
+    np.testing.assert_array_equal(read, fluxes)
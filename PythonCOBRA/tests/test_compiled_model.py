@@ -0,0 +1,114 @@
+"""
+The compiled model kept up to date by the model mutators against a fresh
+convert_sbml_to_cobra and easy_lp of the edited document.
+"""
+
+import gc
+import weakref
+
+import numpy as np
+import pytest
+
+import metabolicModeling as mm
+from synthetic_models import synthetic_model
+
+
+def assert_matches_document(sbml, compiled):
+    cobra = mm.convert_sbml_to_cobra(sbml, compiled.bound)
+    for key in ['lb', 'ub', 'c', 'rev']:
+        np.testing.assert_array_equal(compiled.cobra[key], cobra[key])
+    assert (compiled.cobra['S'] != cobra['S']).nnz == 0
+    _, f_compiled, _ = mm.solve_lp(compiled.lp)
+    _, f_fresh, _ = mm.easy_lp(list(cobra['c']), cobra['S'], list(cobra['b']),
+                               list(cobra['lb']), list(cobra['ub']))
+    np.testing.assert_allclose(f_compiled, f_fresh, rtol=1e-7, atol=1e-7)
+
+
+def mutate(sbml, rng, rIDs, imports):
+    kind = rng.integers(5)
+    if kind == 0:
+        value = float(rng.choice([0., 1., 5., 1000., -1000., mm.INF]))
+        mm.change_rxn_bounds(sbml, list(rng.choice(rIDs, 3)), value,
+                             str(rng.choice(['l', 'u', 'b'])))
+    elif kind == 1:
+        mm.change_objective(sbml, str(rng.choice(rIDs)))
+    elif kind == 2:
+        mm.set_import_bounds(sbml, list(rng.choice(imports, 2)),
+                             float(rng.choice([0., 1., 10.])))
+    elif kind == 3:
+        mm.block_all_imports(sbml)
+    else:
+        mm.set_infinite_bounds(sbml)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_mutator_sequence(seed, capsys):
+    sbml = synthetic_model(95, seed=seed)
+    rng = np.random.default_rng(seed)
+    rIDs = [r.getId() for r in sbml.getModel().getListOfReactions()]
+    imports = [rID for rID in rIDs if rID.startswith('R_EX_')]
+    compiled = mm.get_compiled_model(sbml)
+    for _ in range(30):
+        mutate(sbml, rng, rIDs, imports)
+        assert mm.get_compiled_model(sbml) is compiled
+        assert_matches_document(sbml, compiled)
+
+
+def test_mark_stoichiometry_changed(capsys):
+    sbml = synthetic_model(95, seed=1)
+    compiled = mm.get_compiled_model(sbml)
+    revision = compiled.revision
+    reaction = mm.get_reaction_by_id(sbml, 'HXPRT')
+    reaction.getReactant(0).setStoichiometry(2.)
+    mm.mark_stoichiometry_changed(sbml, 'HXPRT')
+    assert mm.get_compiled_model(sbml) is compiled
+    assert compiled.revision > revision
+    assert_matches_document(sbml, compiled)
+
+
+def test_other_wrapper_of_document(capsys):
+    sbml = synthetic_model(95, seed=1)
+    mm.change_objective(sbml, 'EX_glc(e)')
+    compiled = mm.get_compiled_model(sbml)
+    # libsbml returns a new Python wrapper for the same document
+    other = sbml.getModel().getSBMLDocument()
+    assert other is not sbml
+    mm.change_rxn_bounds(other, 'EX_glc(e)', 3., 'u')
+    _, f_opt = mm.optimize_cobra_model(sbml)
+    assert f_opt == 3.
+    assert mm.get_compiled_model(other) is compiled
+    assert_matches_document(other, compiled)
+    del other
+    gc.collect()
+    # the wrapper that does not own the document leaves the entry alone
+    assert mm.get_compiled_model(sbml) is compiled
+
+
+def test_replaced_reaction_rebuilds():
+    sbml = synthetic_model(95, seed=2)
+    model = sbml.getModel()
+    compiled = mm.get_compiled_model(sbml)
+    revision = compiled.revision
+    # same numbers of species and reactions, different structure
+    removed = model.removeReaction(model.getNumReactions() - 1)
+    added = removed.clone()
+    added.setId('R_replacement')
+    model.addReaction(added)
+    compiled = mm.get_compiled_model(sbml)
+    assert compiled.revision > revision
+    assert compiled.rIDs[-1] == 'R_replacement'
+    assert_matches_document(sbml, compiled)
+
+
+def test_compiled_model_released_with_document():
+    sbml = synthetic_model(95, seed=3)
+    compiled = weakref.ref(mm.get_compiled_model(sbml))
+    del sbml
+    gc.collect()
+    assert compiled() is None
+    sbml = synthetic_model(95, seed=3)
+    compiled = weakref.ref(mm.get_compiled_model(sbml))
+    mm.release_compiled_model(sbml)
+    gc.collect()
+    assert compiled() is None
+    assert mm._compiled_models.get(sbml) is None
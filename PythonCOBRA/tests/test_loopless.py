@@ -0,0 +1,74 @@
+"""
+Loopless FBA and FVA on synthetic models, checked with is_loop_free and
+against the LP.
+"""
+
+import numpy as np
+import pytest
+import scipy.linalg
+
+import loopless
+import metabolicModeling as mm
+from synthetic_models import synthetic_model
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_loop_candidates_cover_nullspace(seed):
+    sbml = synthetic_model(95, seed=seed)
+    S = mm.get_compiled_model(sbml).cobra['S'].tocsc()
+    internal = loopless.get_internal_reactions(S)
+    N = scipy.linalg.null_space(S[:, internal].toarray())
+    in_cycle = internal[np.abs(N).max(axis=1) > 1e-9]
+    candidates = loopless.get_loop_candidates(S, internal)
+    assert set(in_cycle) <= set(candidates)
+
+
+def test_bounds_changed_before_build(capsys):
+    sbml = synthetic_model(95, seed=1)
+    mm.change_objective(sbml, 'EX_glc(e)')
+    mm.get_compiled_model(sbml)
+    mm.change_rxn_bounds(sbml, 'EX_glc(e)', 3., 'u')
+    _, f_opt = loopless.loopless_fba(sbml, precheck=False)
+    assert f_opt == pytest.approx(3.)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_loopless_fba(seed, capsys):
+    sbml = synthetic_model(95, seed=seed)
+    compiled = mm.get_compiled_model(sbml)
+    _, f_lp, _ = mm.solve_lp(compiled.lp)
+    v, f_opt = loopless.loopless_fba(sbml, precheck=False)
+    assert f_opt == pytest.approx(f_lp)
+    assert loopless.is_loop_free(compiled.cobra['S'], v)
+
+
+@pytest.mark.parametrize('precheck', [True, False])
+def test_loop_reactions(precheck, capsys):
+    sbml = synthetic_model(95, seed=1)
+    mm.set_medium(sbml, 'EX_glc(e)', True, [])
+    model = loopless.get_loopless_model(sbml)
+    compiled = model.compiled
+    S = compiled.cobra['S']
+    limited = 0
+    for j in model.loop_rxns:
+        f = np.zeros(len(compiled.rIDs))
+        f[j] = 1.
+        v, f_opt, conv = model.optimize(f, precheck)
+        f_lp = mm.optimize_objectives(compiled, [f])[0]
+        assert f_opt <= f_lp + 1e-7
+        if conv:
+            assert loopless.is_loop_free(S, v)
+        limited += f_opt < f_lp - 1e-7
+    # some fluxes are only reachable through a cycle
+    assert limited > 0
+
+
+def test_loopless_fva(capsys):
+    sbml = synthetic_model(95, seed=0)
+    mm.set_medium(sbml, 'EX_glc(e)', True, [])
+    minimum, maximum = loopless.loopless_fva(sbml, fraction=0.9)
+    assert (minimum <= maximum + 1e-7).all()
+    compiled = mm.get_compiled_model(sbml)
+    j = int(np.flatnonzero(compiled.cobra['c'])[0])
+    _, f_opt = loopless.loopless_fba(sbml)
+    assert 0.9 * f_opt - 1e-6 <= maximum[j] <= f_opt + 1e-6
@@ -0,0 +1,96 @@
+"""
+max_flux_matrix against the previous one-objective-at-a-time maxFlux path.
+"""
+
+import types
+
+import numpy as np
+import pytest
+
+import metabolicModeling as mm
+from conftest import OBJECTIVES
+from synthetic_models import synthetic_model
+
+MEDIA = ['EX_ca2(e)', 'EX_cl(e)', 'EX_fe2(e)', 'EX_fe3(e)', 'EX_h(e)',
+         'EX_h2o(e)', 'EX_k(e)', 'EX_na1(e)', 'EX_nh4(e)', 'EX_so4(e)',
+         'EX_pi(e)']
+CARBON_SOURCES = ['EX_glc(e)', 'EX_fru(e)', 'EX_gln_L(e)', 'EX_trp_L(e)']
+
+
+def old_max_flux(sbml, carbon_source, objective, normoxic):
+    mm.set_medium(sbml, carbon_source, normoxic, MEDIA)
+    mm.change_objective(sbml, objective)
+    obj_max = 1e6
+    mm.change_rxn_bounds(sbml, objective, obj_max, 'u')
+    cobra = mm.convert_sbml_to_cobra(sbml)
+    _, f_opt, _ = mm.easy_lp(list(cobra['c']), cobra['S'], list(cobra['b']),
+                             list(cobra['lb']), list(cobra['ub']))
+    if f_opt > 0.9 * obj_max:
+        f_opt = mm.INF
+    return f_opt
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('normoxic', [True, False])
+def test_max_flux_matrix(seed, normoxic, capsys):
+    sbml = synthetic_model(95, seed=seed)
+    f_opt = mm.max_flux_matrix(sbml, CARBON_SOURCES, OBJECTIVES, normoxic,
+                               MEDIA)
+    assert np.isfinite(f_opt).all() and (f_opt > 0).all()
+    reference = synthetic_model(95, seed=seed)
+    expected = [[old_max_flux(reference, carbon_source, objective, normoxic)
+                 for objective in OBJECTIVES]
+                for carbon_source in CARBON_SOURCES]
+    np.testing.assert_allclose(f_opt, expected, rtol=1e-7, atol=1e-7)
+
+
+class FailingLP(object):
+    '''A Gurobi model whose optimize fails, for checking the cleanup.'''
+
+    def __init__(self, lp):
+        self.lp = lp
+
+    def __getattr__(self, name):
+        return getattr(self.lp, name)
+
+    def optimize(self):
+        raise RuntimeError('optimize failed')
+
+
+def test_bounds_restored_on_error(capsys):
+    sbml = synthetic_model(95, seed=0)
+    mm.set_medium(sbml, 'EX_glc(e)', True, MEDIA)
+    mm.change_rxn_bounds(sbml, 'HXPRT', 10., 'u')
+    compiled = mm.get_compiled_model(sbml)
+    failing = types.SimpleNamespace(cobra=compiled.cobra,
+                                    lp=FailingLP(compiled.lp),
+                                    lpvars=compiled.lpvars)
+    vector = mm.objective_vector(sbml, compiled, 'HXPRT')
+    with pytest.raises(RuntimeError):
+        mm.optimize_objectives(failing, [vector])
+    compiled.lp.update()
+    # Gurobi reports its infinity as inf
+    np.testing.assert_array_equal(
+        compiled.lp.getAttr('UB', compiled.lpvars), compiled.cobra['ub'])
+    np.testing.assert_array_equal(
+        compiled.lp.getAttr('Obj', compiled.lpvars), compiled.cobra['c'])
+
+
+def test_unbounded_and_infeasible(capsys):
+    objectives = ['EX_nh4(e)', 'DM_atp_c_']
+    sbml = synthetic_model(95, seed=0)
+    reference = synthetic_model(95, seed=0)
+    f_opt = mm.max_flux_matrix(sbml, ['EX_glc(e)'], objectives, True, MEDIA)
+    # ammonium is imported without limit
+    assert f_opt[0, 0] == mm.INF
+    assert 0 < f_opt[0, 1] < mm.INF
+    np.testing.assert_array_equal(
+        f_opt[0], [old_max_flux(reference, 'EX_glc(e)', objective, True)
+                   for objective in objectives])
+    # a flux through HXPRT that one unit of glucose cannot supply
+    for model in [sbml, reference]:
+        mm.change_rxn_bounds(model, 'HXPRT', 1000., 'l')
+    f_opt = mm.max_flux_matrix(sbml, ['EX_glc(e)'], objectives, True, MEDIA)
+    assert np.isnan(f_opt).all()
+    assert np.isnan([old_max_flux(reference, 'EX_glc(e)', objective, True)
+                     for objective in objectives]).all()
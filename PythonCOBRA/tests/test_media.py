@@ -0,0 +1,110 @@
+"""
+Compiled media against setting the same medium through the model mutators.
+"""
+
+import numpy as np
+import pytest
+
+import media
+import metabolicModeling as mm
+from conftest import MEDIUM, OBJECTIVES
+from synthetic_models import synthetic_model
+
+
+def mutator_solve(seed, medium):
+    sbml = synthetic_model(95, seed=seed)
+    mm.block_all_imports(sbml)
+    for rID, uptake in medium.items():
+        mm.set_import_bounds(sbml, rID, uptake)
+    return mm.solve_objectives(sbml, OBJECTIVES)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_solve_media(seed, capsys):
+    sbml = synthetic_model(95, seed=seed)
+    other = dict(MEDIUM, **{'EX_fru(e)': 2.})
+    del other['EX_o2(e)']
+    f_opt = media.solve_media(sbml, [MEDIUM, other], OBJECTIVES)
+    np.testing.assert_allclose(f_opt[0], mutator_solve(seed, MEDIUM),
+                               rtol=1e-7, atol=1e-7)
+    np.testing.assert_allclose(f_opt[1], mutator_solve(seed, other),
+                               rtol=1e-7, atol=1e-7)
+    # the compiled model is left as the document describes it
+    compiled = mm.get_compiled_model(sbml)
+    cobra = mm.convert_sbml_to_cobra(sbml)
+    np.testing.assert_array_equal(compiled.cobra['lb'], cobra['lb'])
+    np.testing.assert_array_equal(compiled.cobra['ub'], cobra['ub'])
+
+
+def compiled_delta(sbml, base, medium):
+    # the previous definition: compile the perturbed medium and compare
+    perturbed = media.compile_medium(sbml, medium)
+    changed = (perturbed['lb'] != base['lb']) | (perturbed['ub'] != base['ub'])
+    return {'index': base['index'][changed],
+            'lb': perturbed['lb'][changed],
+            'ub': perturbed['ub'][changed]}
+
+
+@pytest.mark.parametrize('uptake', [1., float('inf')])
+def test_perturbation_deltas(uptake, capsys):
+    sbml = synthetic_model(95, seed=1)
+    medium = dict(MEDIUM, **{'EX_fru(e)': 0.})
+    names, deltas = media.medium_perturbations(sbml, medium, uptake)
+    base = media.compile_medium(sbml, medium)
+    # one drop-one per nutrient, one add-one per other import
+    assert len(names) == len(base['index'])
+    for name, delta in zip(names, deltas):
+        perturbed = dict(medium)
+        if name[0] == '-':
+            del perturbed[name[1:]]
+        else:
+            perturbed[name[1:]] = uptake
+        expected = compiled_delta(sbml, base, perturbed)
+        for key in ['index', 'lb', 'ub']:
+            np.testing.assert_array_equal(delta[key], expected[key])
+    # fructose is in the medium at 0, so dropping it changes nothing
+    assert len(deltas[names.index('-EX_fru(e)')]['index']) == 0
+
+
+def test_perturbations(capsys):
+    sbml = synthetic_model(95, seed=0)
+    names, deltas = media.medium_perturbations(
+        sbml, MEDIUM, uptake=1., candidates=['EX_fru(e)', 'EX_gln_L(e)'])
+    assert names == ['-' + rID for rID in MEDIUM] + \
+        ['+EX_fru(e)', '+EX_gln_L(e)']
+    assert all(len(delta['index']) == 1 for delta in deltas)
+    f_opt = media.solve_perturbations(sbml, MEDIUM, deltas, OBJECTIVES)
+    reduced = dict(MEDIUM)
+    del reduced['EX_glc(e)']
+    np.testing.assert_allclose(f_opt[0], mutator_solve(0, reduced),
+                               rtol=1e-7, atol=1e-7)
+    extended = dict(MEDIUM, **{'EX_fru(e)': 1.})
+    np.testing.assert_allclose(f_opt[len(MEDIUM)],
+                               mutator_solve(0, extended),
+                               rtol=1e-7, atol=1e-7)
+
+
+@pytest.mark.parametrize('extension', ['.csv', '.yaml'])
+def test_load_media(tmp_path, extension):
+    expected = {'glucose': MEDIUM,
+                'fructose': {'EX_fru(e)': 2., 'EX_nh4(e)': 10.}}
+    filename = str(tmp_path / ('media' + extension))
+    with open(filename, 'w') as f:
+        if extension == '.csv':
+            f.write('medium,reaction,uptake\n')
+            for name, medium in expected.items():
+                for rID, uptake in medium.items():
+                    f.write('%s,%s,%r\n' % (name, rID, uptake))
+        else:
+            yaml = pytest.importorskip('yaml')
+            yaml.safe_dump(dict((name, dict((rID, str(uptake))
+                                            for rID, uptake in medium.items()))
+                                for name, medium in expected.items()), f)
+    assert media.load_media(filename) == expected
+
+
+def test_load_media_format(tmp_path):
+    filename = str(tmp_path / 'media.json')
+    open(filename, 'w').close()
+    with pytest.raises(ValueError):
+        media.load_media(filename)
@@ -0,0 +1,125 @@
+"""
+model_statistics against the per-species and per-reaction loops it
+replaced, and the summaries built on it.
+"""
+
+import re
+
+import metabolicModeling as mm
+from synthetic_models import synthetic_model, write_synthetic_models
+
+
+def naive_statistics(sbml):
+    model = sbml.getModel()
+    species_sbo, reaction_sbo = {}, {}
+    for species in model.getListOfSpecies():
+        sbo = species.getSBOTerm()
+        species_sbo[sbo] = species_sbo.get(sbo, 0) + 1
+    appears_in_reaction = []
+    for reaction in model.getListOfReactions():
+        for reference in list(reaction.getListOfReactants()) + \
+                list(reaction.getListOfProducts()):
+            if reference.getSpecies() not in appears_in_reaction:
+                appears_in_reaction.append(reference.getSpecies())
+    nM, nB, nE = 0, 0, 0
+    for species in model.getListOfSpecies():
+        if species.getId() not in appears_in_reaction:
+            nE += 1
+        elif species.getBoundaryCondition():
+            nB += 1
+        else:
+            nM += 1
+
+    def boundary(sID):
+        # strip out format used in recon 2.1
+        return sID == 'M_carbon_e' or \
+            model.getSpecies(sID).getBoundaryCondition()
+    n_source = 0
+    genes = set()
+    for reaction in model.getListOfReactions():
+        sbo = reaction.getSBOTerm()
+        reaction_sbo[sbo] = reaction_sbo.get(sbo, 0) + 1
+        nS = sum(not boundary(reactant.getSpecies())
+                 for reactant in reaction.getListOfReactants())
+        nP = sum(not boundary(product.getSpecies())
+                 for product in reaction.getListOfProducts())
+        if nS == 0 or nP == 0:
+            n_source += 1
+        gene_association = mm.read_notes_field(reaction, 'GENE_ASSOCIATION')
+        genes.update(re.findall(r'\b\S+\b', gene_association))
+    genes.difference_update(['and', 'or', 'AND', 'OR'])
+    return {'species': model.getNumSpecies(),
+            'species_sbo': species_sbo,
+            'variable': nM,
+            'fixed': nB,
+            'non_reactants': nE,
+            'reactions': model.getNumReactions(),
+            'reaction_sbo': reaction_sbo,
+            'non_source_sink': model.getNumReactions() - n_source,
+            'source_sink': n_source,
+            'genes': len(genes),
+            }
+
+
+def add_carbon_species(sbml):
+    '''
+    Add the M_carbon_e species of Recon 2.1, not marked as boundary, with a
+    reaction that is only a source when it is treated as one, and a species
+    in no reaction.
+    '''
+    model = sbml.getModel()
+    for sID in ['M_carbon_e', 'M_unused_c']:
+        species = model.createSpecies()
+        species.setId(sID)
+        species.setCompartment(sID[-1])
+        species.setBoundaryCondition(False)
+    reaction = model.createReaction()
+    reaction.setId('R_carbon_in')
+    reaction.createReactant().setSpecies('M_carbon_e')
+    reaction.createProduct().setSpecies(model.getSpecies(0).getId())
+    model.getReaction(1).unsetSBOTerm()
+    return sbml
+
+
+def test_model_statistics():
+    for seed in range(3):
+        sbml = add_carbon_species(synthetic_model(95, seed=seed))
+        expected = naive_statistics(sbml)
+        stats = mm.model_statistics(sbml)
+        for key, value in expected.items():
+            assert stats[key] == value, key
+        assert stats['non_reactants'] == 1
+        assert -1 in stats['reaction_sbo']
+        # counting M_carbon_e as boundary does not edit the model
+        assert not sbml.getModel().getSpecies('M_carbon_e') \
+            .getBoundaryCondition()
+
+
+def test_model_summary_errors(capsys):
+    sbml = add_carbon_species(synthetic_model(95, seed=0))
+    model = sbml.getModel()
+    without_sbo = ['%s\t%s\thas no SBO term' % (kind, element.getId())
+                   for kind, elements in
+                   [('species', model.getListOfSpecies()),
+                    ('reaction', model.getListOfReactions())]
+                   for element in elements if element.getSBOTerm() == -1]
+    assert len(without_sbo) > 1
+    stats = mm.modelSummary(sbml)
+    out = capsys.readouterr().out
+    assert not any(line in out for line in without_sbo)
+    assert '%g\tsource/sink' % stats['source_sink'] in out
+    mm.modelSummary(sbml, display_errors=True)
+    out = capsys.readouterr().out
+    assert all(line in out.splitlines() for line in without_sbo)
+
+
+def test_summarize_models(tmp_path):
+    sizes = [('small', 95), ('medium', 400)]
+    filenames = write_synthetic_models(str(tmp_path), sizes, seed=1)
+    summary = mm.summarize_models(str(tmp_path), processes=2)
+    assert sorted(summary) == ['medium', 'small']
+    for (label, n_reactions), filename in zip(sizes, filenames):
+        expected = mm.model_statistics_from_file(filename)
+        assert summary[label] == expected
+        assert summary[label]['reactions'] == n_reactions
+        assert summary[label]['model'] == label
@@ -0,0 +1,58 @@
+"""
+Perturbation sweeps on a pool of workers attached to a shared-memory model
+against the serial sweep, and cleanup of the shared segments.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+import media
+import shared_model
+from conftest import MEDIUM, OBJECTIVES
+from synthetic_models import synthetic_model
+
+
+def shm_names():
+    return set(os.listdir('/dev/shm'))
+
+
+@pytest.mark.parametrize('seed', range(2))
+def test_pool_matches_serial(seed, capsys):
+    sbml = synthetic_model(95, seed=seed)
+    names, deltas = media.medium_perturbations(sbml, MEDIUM, uptake=1.)
+    before = shm_names()
+    serial = media.solve_perturbations(sbml, MEDIUM, deltas, OBJECTIVES)
+    pooled = media.solve_perturbations(sbml, MEDIUM, deltas, OBJECTIVES,
+                                       processes=2)
+    assert len(names) == len(deltas) == len(serial)
+    np.testing.assert_allclose(pooled, serial, rtol=1e-7, atol=1e-7)
+    assert shm_names() == before
+
+
+def test_shared_model_arrays():
+    sbml = synthetic_model(95, seed=0)
+    compiled = media.get_compiled_model(sbml)
+    with shared_model.share_model(sbml) as shared:
+        attached = shared_model.attach_model(shared.handle)
+        try:
+            assert attached.rIDs == compiled.rIDs
+            assert (attached.cobra['S'] != compiled.cobra['S']).nnz == 0
+            for key in shared_model.ARRAYS:
+                np.testing.assert_array_equal(attached.cobra[key],
+                                              compiled.cobra[key])
+        finally:
+            attached.close()
+
+
+def test_segments_freed_on_error(monkeypatch):
+    sbml = synthetic_model(95, seed=0)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('cannot attach')
+    monkeypatch.setattr(shared_model, 'SharedModel', fail)
+    before = shm_names()
+    with pytest.raises(RuntimeError):
+        shared_model.share_model(sbml)
+    assert shm_names() == before